@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 import sys
 
@@ -5,6 +6,8 @@ import config
 import setup
 
 if __name__ == "__main__":
+    # The analysis processes of a frozen bundle are started by running it again
+    multiprocessing.freeze_support()
 
     config.defPaths()
     # Compile designer files each time we run if we are in a development environment
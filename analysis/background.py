@@ -0,0 +1,129 @@
+import numpy as np
+
+
+class Background:
+    """Background model that is subtracted from each frame before the analysis.
+
+    The model is either a captured dark frame (averaged over several frames) or an
+    exponentially weighted running average of the frames. All of the buffers are
+    float32 arrays allocated once for the frame size and updated in place, so
+    subtracting and updating the model doesn't allocate anything per frame. The model
+    belongs to one ROI geometry, it is discarded when the geometry changes.
+
+    Attributes:
+        mode: "off", "dark" for a captured dark frame or "running" for a running average.
+        alpha: Weight of the newest frame in the running average.
+    """
+
+    def __init__(self, mode="off", alpha=0.05):
+        self.mode = mode
+        self.alpha = alpha
+        self.model = None
+        self.frame = None
+        self.scratch = None
+        self.geometry = None
+        self.nCapture = 0
+        self.nCaptured = 0
+        self.seeded = False
+
+    def _allocate(self, shape):
+        self.model = np.zeros(shape, dtype="float32")
+        self.frame = np.empty(shape, dtype="float32")
+        self.scratch = np.empty(shape, dtype="float32")
+        self.nCaptured = 0
+        self.seeded = False
+
+    def reset(self):
+        """Discards the model, it is rebuilt from the next frames."""
+        self.model = None
+        self.frame = None
+        self.scratch = None
+        self.geometry = None
+
+    def capture(self, nFrames: int):
+        """Averages the next nFrames frames into a dark frame and switches to "dark" mode."""
+        self.nCapture = nFrames
+        self.nCaptured = 0
+        self.mode = "dark"
+        if self.model is not None:
+            self.model.fill(0.0)
+
+    @property
+    def capturing(self) -> bool:
+        return self.nCaptured < self.nCapture
+
+    def process(self, image: np.ndarray, window=None, geometry=None) -> np.ndarray:
+        """Subtracts the background from the image and updates the model.
+
+        Args:
+            image: 2D array representing image data.
+            window: Index range (iy0, iy1, ix0, ix1) containing the beam, it is left
+                out of the running average so the beam doesn't become background.
+            geometry: Key of the frame's ROI geometry, such as Geometry.key. A frame
+                of the same shape from another part of the sensor or with another
+                binning doesn't match the model. Defaults to the shape of the image.
+
+        The running average starts from the first frame, which has the beam in it. The
+        frames are passed through unchanged until a window is known, then the window
+        in the model is filled with the background around it before the model is used.
+
+        Returns:
+            frame: The background subtracted frame, or the image itself if there is no
+                background model yet. The frame is overwritten by the next call.
+        """
+        if self.mode == "off":
+            return image
+        if geometry is None:
+            geometry = image.shape
+        if self.model is None or self.geometry != geometry:
+            # _allocate restarts the count of captured frames
+            capturing = self.capturing
+            self._allocate(image.shape)
+            self.geometry = geometry
+            if self.mode == "running":
+                self.model[...] = image
+                return image
+            elif not capturing:
+                # The dark frame doesn't match the new ROI, it has to be recaptured
+                self.mode = "off"
+                self.reset()
+                return image
+        if self.mode == "dark" and self.capturing:
+            return self._add_dark(image)
+        if self.mode == "running" and not self.seeded:
+            if window is None:
+                # Without knowing where the beam is the model can't be cleaned up
+                return image
+            self._seed(window)
+        np.subtract(image, self.model, out=self.frame)
+        if self.mode == "running":
+            # model += alpha*(image - model), reusing the subtracted frame
+            np.multiply(self.frame, self.alpha, out=self.scratch)
+            if window is not None:
+                iy0, iy1, ix0, ix1 = window
+                self.scratch[iy0:iy1, ix0:ix1] = 0.0
+            self.model += self.scratch
+        return self.frame
+
+    def _seed(self, window):
+        """Replaces the beam in the first running model with the background around it."""
+        iy0, iy1, ix0, ix1 = window
+        # The ring of pixels just outside the window, where it is inside the frame
+        by0 = max(iy0 - 1, 0)
+        bx0 = max(ix0 - 1, 0)
+        outer = self.model[by0 : iy1 + 1, bx0 : ix1 + 1]
+        inner = np.ones(outer.shape, dtype="bool")
+        inner[iy0 - by0 : iy1 - by0, ix0 - bx0 : ix1 - bx0] = False
+        border = outer[inner]
+        if len(border) == 0:
+            border = self.model
+        self.model[iy0:iy1, ix0:ix1] = np.median(border)
+        self.seeded = True
+
+    def _add_dark(self, image):
+        # Cumulative average, model += (image - model)/n
+        self.nCaptured += 1
+        np.subtract(image, self.model, out=self.scratch)
+        self.scratch *= 1.0 / self.nCaptured
+        self.model += self.scratch
+        return image
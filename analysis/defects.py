@@ -0,0 +1,152 @@
+import os
+
+import numpy as np
+
+
+class DefectCalibration:
+    """Accumulates dark frames and finds the hot and dead pixels in them.
+
+    Only the per pixel sum and sum of squares are kept, so the memory use doesn't grow
+    with the number of frames.
+    """
+
+    def __init__(self, nFrames: int):
+        self.nFrames = nFrames
+        self.count = 0
+        self.shape = None
+        self.total = None
+        self.totalSq = None
+
+    def add(self, image: np.ndarray) -> bool:
+        """Adds a dark frame, returns True once enough frames have been collected."""
+        if self.total is None or image.shape != self.shape:
+            self.shape = image.shape
+            self.count = 0
+            self.total = np.zeros(image.shape)
+            self.totalSq = np.zeros(image.shape)
+        frame = image.astype("float")
+        self.total += frame
+        frame *= frame
+        self.totalSq += frame
+        self.count += 1
+        return self.count >= self.nFrames
+
+    def find_defects(self, threshold: float = 8.0) -> np.ndarray:
+        """Returns a boolean mask of the defective pixels.
+
+        Hot pixels have a dark level more than threshold robust standard deviations
+        (from the median absolute deviation) above the median. Dead or stuck pixels
+        don't change between frames while the typical pixel does.
+
+        Args:
+            threshold: Number of standard deviations from the median for a hot pixel.
+        """
+        mean = self.total / self.count
+        var = np.maximum(self.totalSq / self.count - mean**2, 0.0)
+        median = np.median(mean)
+        sigma = 1.4826 * np.median(np.abs(mean - median))
+        # Quantized dark frames often have a MAD of zero, don't flag every pixel above it
+        sigma = max(sigma, np.sqrt(np.median(var)), 0.5)
+        defects = mean > median + threshold * sigma
+        typicalVar = np.median(var)
+        if self.count > 1 and typicalVar > 0.0:
+            defects |= var < 1e-3 * typicalVar
+        return defects
+
+
+class DefectMap:
+    """Locations of the defective pixels of a camera.
+
+    The defects are stored in sensor pixel coordinates (the ROI offset is added), along
+    with the binning they were calibrated at, so a corrector can be built for any ROI.
+    """
+
+    def __init__(self, rows, cols, binningX=1, binningY=1):
+        self.rows = np.asarray(rows, dtype="int64")
+        self.cols = np.asarray(cols, dtype="int64")
+        self.binningX = binningX
+        self.binningY = binningY
+
+    @classmethod
+    def from_mask(cls, mask, sx=0, sy=0, binningX=1, binningY=1):
+        rows, cols = np.nonzero(mask)
+        return cls(rows + sy, cols + sx, binningX, binningY)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(
+            path,
+            rows=self.rows,
+            cols=self.cols,
+            binning=np.array([self.binningX, self.binningY]),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f["rows"], f["cols"], *f["binning"])
+
+    def corrector(self, shape, sx=0, sy=0, binningX=1, binningY=1):
+        """Returns a DefectCorrector for the ROI, None if the binning doesn't match."""
+        if binningX != self.binningX or binningY != self.binningY:
+            return None
+        return DefectCorrector(self.rows - sy, self.cols - sx, shape)
+
+
+def defect_map_path(directory, serial_number):
+    """Returns the path of the defect map saved for a camera."""
+    return os.path.join(directory, f"defects_{serial_number}.npz")
+
+
+class DefectCorrector:
+    """Replaces defective pixels with the median of their 8 neighbors.
+
+    The flat indices of the defects and of their neighbors are computed once, so each
+    frame only costs a gather and a median over the defects rather than a median filter
+    over the whole frame. Neighbors outside the image are reflected back into it.
+    """
+
+    def __init__(self, rows, cols, shape):
+        Y, X = shape
+        rows = np.asarray(rows)
+        cols = np.asarray(cols)
+        inside = (rows >= 0) & (rows < Y) & (cols >= 0) & (cols < X)
+        rows = rows[inside]
+        cols = cols[inside]
+        self.shape = tuple(shape)
+        self.index = rows * X + cols
+        dr, dc = np.mgrid[-1:2, -1:2]
+        keep = (dr != 0) | (dc != 0)
+        nRows = _reflect(rows[:, None] + dr[keep], Y)
+        nCols = _reflect(cols[:, None] + dc[keep], X)
+        self.neighbors = nRows * X + nCols
+
+    def __len__(self):
+        return len(self.index)
+
+    def correct(self, image: np.ndarray) -> np.ndarray:
+        """Corrects the defective pixels of the image and returns it.
+
+        The correction is done in place unless the image is read only or not contiguous.
+        """
+        if len(self.index) == 0:
+            return image
+        if not image.flags.c_contiguous or not image.flags.writeable:
+            image = np.array(image)
+        flat = image.reshape(-1)
+        values = np.median(flat[self.neighbors], axis=1)
+        if image.dtype.kind in "ui":
+            values = np.rint(values)
+        flat[self.index] = values
+        return image
+
+
+def _reflect(index, N):
+    """Reflects indices that fall outside [0, N) back inside, without repeating the edge."""
+    if N == 1:
+        return np.zeros_like(index)
+    index = np.where(index < 0, -index, index)
+    return np.where(index >= N, 2 * (N - 1) - index, index)
@@ -0,0 +1,191 @@
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import analysis.image as an
+import analysis.timing as timing
+
+# Slots start on a multiple of this many bytes, which keeps the frames aligned
+SLOT_ALIGNMENT = 64
+
+# Set in each pool process by _init_process
+_shm = None
+_slotBytes = None
+
+
+def _slot_frame(buffer, slotBytes, slot, shape, dtype):
+    """Returns the frame of the given shape and dtype at the start of a slot."""
+    return np.ndarray(shape, dtype, buffer=buffer, offset=slot * slotBytes)
+
+
+class SharedFrameRing:
+    """Preallocated frame slots in shared memory.
+
+    Frames are copied into a free slot and only the slot index, shape and dtype are sent
+    to the pool processes, which map the same memory, so the pixel data is never
+    pickled. Each slot holds any frame of up to slotBytes bytes, so frames can change
+    size, as the automatic ROI does, without a new ring.
+    """
+
+    def __init__(self, nSlots, slotBytes):
+        self.nSlots = nSlots
+        self.slotBytes = -(-max(1, slotBytes) // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+        self.shm = shared_memory.SharedMemory(create=True, size=nSlots * self.slotBytes)
+        self._lock = threading.Lock()
+        self._free = deque(range(nSlots))
+
+    def fits(self, image):
+        return image.nbytes <= self.slotBytes
+
+    def write(self, image):
+        """Copies the image into a free slot, returns the slot or None if all are in use."""
+        with self._lock:
+            if len(self._free) == 0:
+                return None
+            slot = self._free.popleft()
+        frame = _slot_frame(
+            self.shm.buf, self.slotBytes, slot, image.shape, image.dtype
+        )
+        np.copyto(frame, image)
+        return slot
+
+    def release(self, slot):
+        with self._lock:
+            self._free.append(slot)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _init_process(name, slotBytes):
+    global _shm
+    global _slotBytes
+    # The pool processes share the resource tracker of the process that created the
+    # memory, so attaching here (which registers it again before Python 3.13) doesn't
+    # unlink it when a pool process exits
+    try:
+        _shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        _shm = shared_memory.SharedMemory(name=name)
+    _slotBytes = slotBytes
+
+
+def _analyze(slot, shape, dtype, x, y, config, projections, previousPx, previousPy):
+    """Runs the beam analysis on a frame in shared memory.
+
+    The frame statistics describe the raw frame, not the background subtracted one
+    that is analyzed here, so they are computed by the caller. projections are the
+    frame's projections if it already has them, or None.
+    """
+    timestamps = []
+    timing.stamp(timestamps, "start")
+    image = _slot_frame(_shm.buf, _slotBytes, slot, shape, dtype)
+    window = None
+    if config.get("trackingROI", False):
+        result = an.trackImageCenter(
+            image, x, y, config, previousPx, previousPy, projections
+        )
+        window = result[5]
+        result = result[:5]
+    else:
+        result = an.findImageCenter(
+            image, x, y, config, previousPx, previousPy, projections
+        )
+    centroid, px, py, x_proj, y_proj = result
+    timing.stamp(timestamps, "analysis")
+    return {
+        "centroid": centroid,
+        "px": px,
+        "py": py,
+        "x_proj": x_proj,
+        "y_proj": y_proj,
+        "window": window,
+        "timestamps": timestamps,
+    }
+
+
+class ProcessPoolAnalyzer:
+    """Runs the beam analysis of successive frames in a pool of processes.
+
+    Frames are handed over through a SharedFrameRing with twice as many slots as
+    processes. When every slot is busy the frame is dropped rather than queued, so the
+    latency stays bounded. The processes map the ring when they start, so its slots fit
+    the largest frame so far and only a larger frame restarts them. Results are passed
+    to callback(frameId, result) from a pool thread in completion order, it is up to
+    the caller to put them back in order.
+
+    Args:
+        nProcesses: Number of analysis processes.
+        callback: Called with (frameId, result), result is None if the analysis failed.
+    """
+
+    def __init__(self, nProcesses, callback):
+        self.nProcesses = nProcesses
+        self.nSlots = 2 * nProcesses
+        self.callback = callback
+        self.ring = None
+        self.pool = None
+        self.submitted = 0
+        self.dropped = 0
+
+    def _start(self, image):
+        self.shutdown()
+        self.ring = SharedFrameRing(self.nSlots, image.nbytes)
+        # Forking copies the locks held by the gui's, camera's and worker's threads,
+        # a child could deadlock on one, so the processes are started fresh
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.nProcesses,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_process,
+            initargs=(self.ring.shm.name, self.ring.slotBytes),
+        )
+
+    def submit(self, frameId, image, x, y, config, projections, previousPx, previousPy):
+        """Submits a frame for analysis, returns False if it was dropped."""
+        if self.ring is None or not self.ring.fits(image):
+            self._start(image)
+        slot = self.ring.write(image)
+        if slot is None:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        future = self.pool.submit(
+            _analyze,
+            slot,
+            image.shape,
+            image.dtype.str,
+            x,
+            y,
+            dict(config),
+            projections,
+            previousPx,
+            previousPy,
+        )
+        ring = self.ring
+        future.add_done_callback(lambda f: self._done(f, frameId, slot, ring))
+        return True
+
+    def _done(self, future, frameId, slot, ring):
+        ring.release(slot)
+        if future.cancelled():
+            self.callback(frameId, None)
+            return
+        try:
+            result = future.result()
+        except Exception as error:
+            print(f"Analysis of frame {frameId} failed: {error}")
+            result = None
+        self.callback(frameId, result)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
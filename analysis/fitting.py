@@ -0,0 +1,159 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def fit_gaussians(
+    x: np.ndarray,
+    y: np.ndarray,
+    p0: np.ndarray,
+    mask: np.ndarray = None,
+    maxIterations: int = 100,
+    tolerance: float = 1e-8,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Fits N independent Gaussians at once with a vectorized Levenberg-Marquardt solver.
+
+    Every curve has its own damping parameter and is updated independently, the only
+    thing shared is the loop, so a batch of fits costs a handful of numpy calls per
+    iteration instead of a curve_fit call per curve. Curves of different lengths can be
+    fit together by padding them to the same length and masking out the padding.
+
+    Args:
+        x: Coordinates, shape (N, L) or (L,) if all curves share the coordinates.
+        y: Data to fit, shape (N, L).
+        p0: Initial guesses, shape (N, 4) with columns (A, x0, sigma, offset).
+        mask: Boolean array of shape (N, L), False for samples to ignore, defaults to None.
+        maxIterations: Maximum number of iterations, defaults to 100.
+        tolerance: Relative change in the cost at which a fit is converged.
+
+    Returns:
+        p: Fit parameters, shape (N, 4) with columns (A, x0, sigma, offset).
+        success: Boolean array of shape (N,), False where the fit failed or didn't converge.
+    """
+    y = np.asarray(y, dtype="float")
+    N, L = y.shape
+    x = np.broadcast_to(np.asarray(x, dtype="float"), (N, L))
+    if mask is None:
+        w = np.ones((N, L))
+    else:
+        w = np.asarray(mask, dtype="float")
+    # Fit C = 1/(2 sigma^2) rather than sigma, it has a simpler Jacobian
+    p = np.array(p0, dtype="float", copy=True)
+    p[:, 2] = np.where(p[:, 2] < 1e-3, 10.0, p[:, 2])
+    p[:, 2] = 1 / (2 * p[:, 2] ** 2)
+
+    lam = np.full(N, 1e-3)
+    e = _exp(x, p)
+    r = w * (y - p[:, 0, None] * e - p[:, 3, None])
+    cost = np.sum(r**2, axis=1)
+    active = np.arange(N)
+    eye = np.eye(4)
+    for _ in range(maxIterations):
+        # Only the fits that haven't converged yet are updated
+        xa = x[active]
+        wa = w[active]
+        pa = p[active]
+        # The Jacobian is stored transposed, (N, 4, L), so the products are contiguous
+        JT = _gaussian_jac(xa, pa, e[active])
+        JT *= wa[:, None, :]
+        JTJ = JT @ JT.transpose(0, 2, 1)
+        g = (JT @ r[active][..., None])[..., 0]
+        diag = np.einsum("nii->ni", JTJ)
+        # Marquardt scaling with a floor keeps the system solvable for flat curves
+        damping = lam[active, None] * (
+            diag + 1e-12 * np.max(diag, axis=1, keepdims=True)
+        )
+        M = JTJ + damping[:, :, None] * eye
+        try:
+            step = np.linalg.solve(M, g[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            step = (np.linalg.pinv(M) @ g[..., None])[..., 0]
+        pNew = pa + step
+        with np.errstate(over="ignore", invalid="ignore"):
+            eNew = _exp(xa, pNew)
+            rNew = wa * (y[active] - pNew[:, 0, None] * eNew - pNew[:, 3, None])
+            costNew = np.sum(rNew**2, axis=1)
+        accept = (costNew < cost[active]) & (pNew[:, 2] > 0.0) & np.isfinite(costNew)
+        converged = accept & (cost[active] - costNew <= tolerance * cost[active])
+        index = active[accept]
+        p[index] = pNew[accept]
+        e[index] = eNew[accept]
+        r[index] = rNew[accept]
+        cost[index] = costNew[accept]
+        lam[active] = np.where(accept, lam[active] * 0.1, lam[active] * 10.0)
+        # A fit that can't be improved even with heavy damping is at its minimum
+        converged |= lam[active] > 1e12
+        active = active[~converged]
+        if len(active) == 0:
+            break
+
+    success = np.ones(N, dtype="bool")
+    success[active] = False
+    success &= np.all(np.isfinite(p), axis=1) & (p[:, 2] > 0.0)
+    p[:, 2] = 1 / np.sqrt(2 * np.abs(p[:, 2]))
+    return p, success
+
+
+def fit_projections(
+    x_proj: np.ndarray,
+    y_proj: np.ndarray,
+    x: np.ndarray,
+    y: np.ndarray,
+    p0x: np.ndarray,
+    p0y: np.ndarray,
+):
+    """Fits Gaussians to stacks of x and y projections in a single batched fit.
+
+    Args:
+        x_proj: x projections, shape (M, X) or (X,).
+        y_proj: y projections, shape (M, Y) or (Y,).
+        x: Center coordinates of each pixel in the x direction.
+        y: Center coordinates of each pixel in the y direction.
+        p0x: Initial guesses for the x fits (A, x0, sigma, offset), shape (M, 4) or (4,).
+        p0y: Initial guesses for the y fits (A, y0, sigma, offset), shape (M, 4) or (4,).
+
+    Returns:
+        px: Fit parameters for the x fits, None in place of any failed fit.
+        py: Fit parameters for the y fits, None in place of any failed fit.
+    """
+    x_proj = np.atleast_2d(x_proj)
+    y_proj = np.atleast_2d(y_proj)
+    M, X = x_proj.shape
+    Y = y_proj.shape[1]
+    L = max(X, Y)
+    # Pad the shorter projections and mask the padding out of the fit
+    coord = np.zeros((2 * M, L))
+    data = np.zeros((2 * M, L))
+    mask = np.zeros((2 * M, L), dtype="bool")
+    coord[:M, :X] = x
+    coord[M:, :Y] = y
+    data[:M, :X] = x_proj
+    data[M:, :Y] = y_proj
+    mask[:M, :X] = True
+    mask[M:, :Y] = True
+    p0 = np.concatenate(
+        (np.broadcast_to(p0x, (M, 4)), np.broadcast_to(p0y, (M, 4))), axis=0
+    )
+    p, success = fit_gaussians(coord, data, p0, mask=mask)
+    px = [p[i] if success[i] else None for i in range(M)]
+    py = [p[M + i] if success[M + i] else None for i in range(M)]
+    return px, py
+
+
+def _exp(x, p):
+    """Returns the exponential term of the Gaussian for each row of parameters."""
+    return np.exp(-p[:, 2, None] * (x - p[:, 1, None]) ** 2)
+
+
+def _gaussian_jac(x, p, e):
+    """Transposed Jacobian of A*e + offset with respect to (A, x0, C, offset)."""
+    A, x0, C = (p[:, i, None] for i in range(3))
+    dx = x - x0
+    JT = np.empty((x.shape[0], 4, x.shape[1]))
+    JT[:, 0] = e
+    np.multiply(e, dx, out=JT[:, 1])
+    np.multiply(JT[:, 1], dx, out=JT[:, 2])
+    JT[:, 1] *= 2 * A * C
+    JT[:, 2] *= -A
+    JT[:, 3] = 1.0
+    return JT
@@ -0,0 +1,61 @@
+import numpy as np
+
+import analysis.image as an
+
+
+class Geometry:
+    """Precomputed arrays for one ROI geometry, shared by every frame with that geometry.
+
+    The coordinate arrays are read only, so they can be handed to the analysis and the
+    gui without copying. Other per geometry precomputations (index maps, defect
+    correctors, ...) are built once with get() and kept until the geometry changes. Only
+    the maxEntries most recently created values are kept.
+    """
+
+    maxEntries = 16
+
+    def __init__(self, shape, sx, sy, scalex, scaley):
+        self.key = (tuple(shape), sx, sy, scalex, scaley)
+        self.shape = tuple(shape)
+        # get_xy_arrays only needs the shape of the image
+        self.x, self.y = an.get_xy_arrays(
+            np.broadcast_to(0, shape), sx, sy, scalex, scaley
+        )
+        self.x.flags.writeable = False
+        self.y.flags.writeable = False
+        self._cache = {}
+
+    def get(self, name, factory):
+        """Returns the value stored under name, creating it with factory(self) if needed.
+
+        Array values are made read only since they are shared between frames.
+        """
+        if name not in self._cache:
+            if len(self._cache) >= self.maxEntries:
+                del self._cache[next(iter(self._cache))]
+            value = factory(self)
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            self._cache[name] = value
+        return self._cache[name]
+
+
+class GeometryCache:
+    """Hands out the Geometry for a frame, rebuilding it only when the ROI changes."""
+
+    def __init__(self):
+        self.geometry = None
+
+    def get(self, shape, sx=0, sy=0, scalex=1.0, scaley=1.0) -> Geometry:
+        key = (tuple(shape), sx, sy, scalex, scaley)
+        if self.geometry is None or self.geometry.key != key:
+            self.geometry = Geometry(shape, sx, sy, scalex, scaley)
+        return self.geometry
+
+    def invalidate(self):
+        """Drops the cached geometry and every value built with Geometry.get().
+
+        A change of the ROI or binning is caught by the key, this is only needed when
+        something else a value was built from changes, such as the defect map.
+        """
+        self.geometry = None
@@ -5,6 +5,8 @@ import numpy as np
 import scipy.optimize as opt
 from scipy.ndimage import median_filter
 
+import analysis.fitting as fitting
+
 
 def get_xy_arrays(
     image: np.ndarray, sx: int = 0, sy: int = 0, xscale: float = 1.0, yscale: float = 1.0
@@ -38,6 +40,11 @@ def gaussian_fit_projections(
     estimateCen=False,
     estimateOffset=False,
     medianFilter=False,
+    fastFit=False,
+    fastFitTolerance=0.05,
+    jacobian=False,
+    fitMethod="trf",
+    projections=None,
 ):
     """Fits a Gaussian to the projections of an image.
 
@@ -49,6 +56,12 @@ def gaussian_fit_projections(
         y: Center coordinates of each pixel in the y direction.
         p0x: Initial guess for the x fit (A, x0, sigma, offset).
         p0y: Initial guess for the y fit (A, y0, sigma, offset).
+        fastFit: Try the closed form log-parabola fit before the nonlinear fit.
+        fastFitTolerance: Largest relative rms residual accepted from the fast fit.
+        jacobian: Use the analytic Jacobian instead of finite differences.
+        fitMethod: "trf" for the bounded fit, "lm" for the unbounded log fit or "batch"
+            to fit both projections together with fitting.fit_projections.
+        projections: Precomputed (x_proj, y_proj) of the image, ignored with medianFilter.
 
     Returns:
         x_proj: Projection of the image in x after filtering.
@@ -58,8 +71,12 @@ def gaussian_fit_projections(
     """
     if medianFilter:
         image = median_filter(image, 3)
-    x_proj = image.sum(axis=0, dtype="float")
-    y_proj = image.sum(axis=1, dtype="float")
+        projections = None
+    if projections is not None:
+        x_proj, y_proj = projections
+    else:
+        x_proj = image.sum(axis=0, dtype="float")
+        y_proj = image.sum(axis=1, dtype="float")
 
     # Use the maximum value of the projections as the amplitude
     if estimateA:
@@ -77,58 +94,493 @@ def gaussian_fit_projections(
     if estimateOffset:
         p0x[3] = np.average(x_proj[0:10])
         p0y[3] = np.average(y_proj[0:10])
+    px = None
+    py = None
+    # Only fall back to the nonlinear fit when the fast estimate is poor
+    if fastFit:
+        px = fast_gaussian_fit(x, x_proj, tolerance=fastFitTolerance)
+        py = fast_gaussian_fit(y, y_proj, tolerance=fastFitTolerance)
+    # Fit both projections in a single vectorized call
+    if fitMethod == "batch" and (px is None or py is None):
+        p0 = np.array([p0x, p0y], dtype="float")
+        # If we start fitting a hot pixel, snap out of it!
+        p0[p0[:, 2] < 1.0, 2] = 10.0
+        bx, by = fitting.fit_projections(x_proj, y_proj, x, y, p0[0], p0[1])
+        if px is None:
+            px = bx[0]
+        if py is None:
+            py = by[0]
+    if px is None:
+        px = _fit_projection(x, x_proj, p0x, jacobian, fitMethod)
+    if py is None:
+        py = _fit_projection(y, y_proj, p0y, jacobian, fitMethod)
+    return x_proj, y_proj, px, py
+
+
+def _fit_projection(x, proj, p0, jacobian=False, method="trf"):
+    """Fits a Gaussian to a single projection, returns None if the fit fails.
+
+    method="trf" fits _gaussian with bounds on the parameters, method="lm" fits the
+    unbounded _gaussian_log with Levenberg-Marquardt, which is faster per iteration.
+    """
+    p0 = list(p0)
     # If we start fitting a hot pixel, snap out of it!
-    if p0x[2] < 1.0:
-        p0x[2] = 10.0
-    if p0y[2] < 1.0:
-        p0y[2] = 10.0
-    p0x[2] = 1 / (2 * p0x[2] ** 2)
-    p0y[2] = 1 / (2 * p0y[2] ** 2)
-    boundsx = ([0.0, x[0], 0.0, 0.0], [np.inf, x[-1], np.inf, np.inf])
-    boundsy = ([0.0, y[0], 0.0, 0.0], [np.inf, y[-1], np.inf, np.inf])
+    if p0[2] < 1.0:
+        p0[2] = 10.0
+    p0[2] = 1 / (2 * p0[2] ** 2)
+    if method == "lm":
+        p0[0] = np.log(max(p0[0], 1.0))
+        p0[2] = np.log(p0[2])
+        jac = _gaussian_log_jac if jacobian else None
+        try:
+            p, covariance = opt.curve_fit(
+                _gaussian_log, x, proj, p0=p0, jac=jac, method="lm"
+            )
+        except (RuntimeError, ValueError, TypeError):
+            # The same failures as the bounded fit, fewer points than parameters is a
+            # TypeError
+            return None
+        if not np.all(np.isfinite(p)):
+            return None
+        p[0] = np.exp(p[0])
+        p[2] = 1 / np.sqrt(2 * np.exp(p[2]))
+        return p
+    bounds = ([0.0, x[0], 0.0, 0.0], [np.inf, x[-1], np.inf, np.inf])
+    jac = _gaussian_jac if jacobian else None
     try:
-        px, covariancex = opt.curve_fit(_gaussian, x, x_proj, p0=p0x, bounds=boundsx)
-        px[2] = 1 / np.sqrt(2 * px[2])
-    except RuntimeError:
-        px = None
+        p, covariance = opt.curve_fit(_gaussian, x, proj, p0=p0, bounds=bounds, jac=jac)
+        p[2] = 1 / np.sqrt(2 * p[2])
+    except (RuntimeError, TypeError):
+        p = None
     except ValueError:
-        px = None
+        p = None
         print(
-            f"Fit failed. Guess of: {p0x} is not within bounds ({boundsx[0]}, {boundsx[1]})"
+            f"Fit failed. Guess of: {p0} is not within bounds ({bounds[0]}, {bounds[1]})"
         )
+    return p
+
+
+def fast_gaussian_fit(x, proj, tolerance=0.05, threshold=0.2):
+    """Fits a Gaussian to a projection with a weighted quadratic fit to its logarithm.
+
+    The offset is estimated from the edges of the projection and a parabola is fit to
+    the log of the samples around the peak that are above threshold times the peak,
+    weighted by the square of the sample value to undo the noise amplification of the
+    logarithm (Caruana's method with Guo's weighting). The fit is closed form, so it is
+    much faster than curve_fit, but it is only accurate for clean, Gaussian-like beams.
+
+    Args:
+        x: Center coordinates of each pixel.
+        proj: Projection of the image.
+        tolerance: Largest rms residual, relative to the amplitude, that is accepted.
+        threshold: Fraction of the peak above which samples are used in the fit.
+
+    Returns:
+        p: Fit parameters (A, x0, sigma, offset) or None if the fit is poor.
+    """
+    N = max(1, min(10, len(proj) // 4))
+    offset = 0.5 * (np.mean(proj[:N]) + np.mean(proj[-N:]))
+    i = np.argmax(proj)
+    peak = proj[i] - offset
+    if peak <= 0.0:
+        return None
+    # Use the contiguous region around the peak that is above the threshold
+    above = proj > offset + threshold * peak
+    left = np.flatnonzero(~above[:i])
+    right = np.flatnonzero(~above[i:])
+    lo = left[-1] + 1 if len(left) > 0 else 0
+    hi = i + right[0] if len(right) > 0 else len(proj)
+    if hi - lo < 3:
+        return None
+    # Center the coordinates on the peak to keep the normal equations well conditioned
+    xs = x[lo:hi] - x[i]
+    ys = proj[lo:hi] - offset
+    V = np.vander(xs, 3, increasing=True)
+    Vw = V * (ys**2)[:, None]
     try:
-        py, covariancey = opt.curve_fit(_gaussian, y, y_proj, p0=p0y, bounds=boundsy)
-        py[2] = 1 / np.sqrt(2 * py[2])
-    except RuntimeError:
-        py = None
-    except ValueError:
-        py = None
-        print(
-            f"Fit failed. Guess of: {p0y} is not within bounds ({boundsy[0]}, {boundsy[1]})"
-        )
+        a, b, c = np.linalg.solve(Vw.T @ V, Vw.T @ np.log(ys))
+    except np.linalg.LinAlgError:
+        return None
+    if c >= 0.0:
+        return None
+    sigma = np.sqrt(-1 / (2 * c))
+    x0 = x[i] - b / (2 * c)
+    A = np.exp(a - b**2 / (4 * c))
+    residual = proj[lo:hi] - gaussian(x[lo:hi], A, x0, sigma, offset)
+    if np.sqrt(np.mean(residual**2)) > tolerance * A:
+        return None
+    return np.array([A, x0, sigma, offset])
+
+
+def moment_projections(
+    image: np.ndarray,
+    x: np.ndarray,
+    y: np.ndarray,
+    apertureFactor=3.0,
+    maxIterations=10,
+    medianFilter=False,
+    projections=None,
+):
+    """Calculates the beam centroid and width from the moments of the image (ISO 11146).
+
+    The background level is estimated from the pixels along the edge of the image and
+    subtracted from the projections. The first and second moments are then calculated
+    inside a rectangular aperture which is iteratively shrunk to apertureFactor times
+    the D4σ beam width around the centroid. All of the moments are taken from the
+    projections of the image, so each iteration is a single pass over the aperture.
+
+    If the moments can't be calculated (no signal above the background), None will be
+    returned instead of the parameters for an axis.
+
+    Args:
+        image: 2D array representing image data.
+        x: Center coordinates of each pixel in the x direction.
+        y: Center coordinates of each pixel in the y direction.
+        apertureFactor: Size of the aperture in units of the D4σ width, defaults to 3.
+        maxIterations: Maximum number of aperture iterations, defaults to 10.
+        projections: Precomputed (x_proj, y_proj) of the image, ignored with medianFilter.
+
+    Returns:
+        x_proj: Projection of the image in x after filtering.
+        y_proj: Projection of the image in y after filtering.
+        px: Equivalent Gaussian parameters for x (A, x0, sigma, offset), sigma is D4σ/4.
+        py: Equivalent Gaussian parameters for y (A, y0, sigma, offset), sigma is D4σ/4.
+    """
+    if medianFilter:
+        image = median_filter(image, 3)
+        projections = None
+    if projections is not None:
+        x_proj, y_proj = projections
+    else:
+        x_proj = image.sum(axis=0, dtype="float")
+        y_proj = image.sum(axis=1, dtype="float")
+    Y, X = image.shape
+
+    # Per pixel background from the outermost rows and columns of the image
+    N = max(1, min(10, X // 10, Y // 10))
+    edge = x_proj[:N].sum() + x_proj[-N:].sum() + y_proj[:N].sum() + y_proj[-N:].sum()
+    background = edge / (2 * N * (X + Y))
+
+    # Noise over the full frame dominates the second moment on large sensors, so the
+    # first aperture is placed using the peak and FWHM of the projections instead
+    ix = _initial_aperture(x, x_proj - background * Y, apertureFactor)
+    iy = _initial_aperture(y, y_proj - background * X, apertureFactor)
+    px = None
+    py = None
+    if ix is None or iy is None:
+        maxIterations = 0
+    for _ in range(maxIterations):
+        sub = image[iy[0] : iy[1], ix[0] : ix[1]]
+        x_win = sub.sum(axis=0, dtype="float") - background * (iy[1] - iy[0])
+        y_win = sub.sum(axis=1, dtype="float") - background * (ix[1] - ix[0])
+        mx = _moments(x[ix[0] : ix[1]], x_win)
+        my = _moments(y[iy[0] : iy[1]], y_win)
+        if mx is None or my is None:
+            px = None
+            py = None
+            break
+        px = mx
+        py = my
+        ix_new = _aperture(x, mx[0], 4 * apertureFactor * mx[1])
+        iy_new = _aperture(y, my[0], 4 * apertureFactor * my[1])
+        if ix_new == ix and iy_new == iy:
+            break
+        ix = ix_new
+        iy = iy_new
+
+    if px is not None:
+        px = _moments_to_gaussian(x, px, background * Y)
+        py = _moments_to_gaussian(y, py, background * X)
     return x_proj, y_proj, px, py
 
 
+def _moments(x, proj):
+    """Returns the first moment and the square root of the second moment of proj."""
+    total = proj.sum()
+    if total <= 0.0:
+        return None
+    x0 = np.dot(x, proj) / total
+    var = np.dot((x - x0) ** 2, proj) / total
+    if var <= 0.0:
+        return None
+    return x0, np.sqrt(var), total
+
+
+def _initial_aperture(x, proj, apertureFactor):
+    """Returns the index range of an aperture around the peak of proj sized from its FWHM."""
+    i = np.argmax(proj)
+    if proj[i] <= 0.0:
+        return None
+    fwhm = (
+        np.count_nonzero(proj > 0.5 * proj[i]) * abs(x[-1] - x[0]) / max(len(x) - 1, 1)
+    )
+    # D4σ of a Gaussian is 4/2.355 times the FWHM
+    return _aperture(x, x[i], apertureFactor * 1.7 * max(fwhm, 1.0))
+
+
+def _aperture(x, x0, width):
+    """Returns the index range of the pixels in x within width/2 of x0."""
+    i0 = int(np.searchsorted(x, x0 - 0.5 * width))
+    i1 = int(np.searchsorted(x, x0 + 0.5 * width))
+    # Keep at least a few pixels in the aperture so the moments stay defined
+    if i1 - i0 < 3:
+        i0 = max(0, i0 - 1)
+        i1 = min(len(x), i1 + 1)
+    return [i0, i1]
+
+
+def _moments_to_gaussian(x, moments, offset):
+    """Converts the moments of a projection to parameters of an equivalent Gaussian."""
+    x0, sigma, total = moments
+    dx = abs(x[1] - x[0]) if len(x) > 1 else 1.0
+    A = total * dx / (sigma * np.sqrt(2 * np.pi))
+    return np.array([A, x0, sigma, offset])
+
+
 def _gaussian(x, A, x0, C, offset):
     y = A * np.exp(-C * ((x - x0) ** 2)) + offset
     return y
 
 
+def _gaussian_jac(x, A, x0, C, offset):
+    """Analytic Jacobian of _gaussian with respect to (A, x0, C, offset)."""
+    dx = x - x0
+    e = np.exp(-C * dx**2)
+    J = np.empty((len(x), 4))
+    J[:, 0] = e
+    J[:, 1] = 2 * A * C * dx * e
+    J[:, 2] = -A * dx**2 * e
+    J[:, 3] = 1.0
+    return J
+
+
+def _gaussian_log(x, lnA, x0, lnC, offset):
+    """Gaussian parameterized by log(A) and log(C) so it can be fit without bounds."""
+    y = np.exp(lnA - np.exp(lnC) * ((x - x0) ** 2)) + offset
+    return y
+
+
+def _gaussian_log_jac(x, lnA, x0, lnC, offset):
+    """Analytic Jacobian of _gaussian_log with respect to (lnA, x0, lnC, offset)."""
+    dx = x - x0
+    C = np.exp(lnC)
+    Ae = np.exp(lnA - C * dx**2)
+    J = np.empty((len(x), 4))
+    J[:, 0] = Ae
+    J[:, 1] = 2 * C * dx * Ae
+    J[:, 2] = -C * dx**2 * Ae
+    J[:, 3] = 1.0
+    return J
+
+
 def gaussian(x, A, x0, sigma, offset):
     y = A * np.exp(-((x - x0) ** 2) / (2 * sigma**2)) + offset
     return y
 
 
-def findImageCenter(image, x, y, config, previousPx, previousPy):
-    medianFilter = False
-    if "medianFilter" in config:
-        medianFilter = config["medianFilter"]
+def findImageCenter(image, x, y, config, previousPx, previousPy, projections=None):
+    """Finds the center of the beam in the image.
+
+    The analysis is selected with config["analysis"]: "gaussian" (default) fits a
+    Gaussian to each projection, "moments" uses the ISO 11146 first and second moments.
+    With config["fastFit"] the Gaussian fit tries the closed form estimate first,
+    config["jacobian"] and config["fitMethod"] are passed to gaussian_fit_projections.
+    With config["pyramid"] the beam is first found on a reduced image, see
+    _pyramid_projections, and the projections only cover the refined region.
+    Projections of the image that were already calculated can be passed in projections.
+
+    Returns:
+        centroid: Tuple of the (x, y) center of the beam.
+        px: Parameters for the x projection (A, x0, sigma, offset).
+        py: Parameters for the y projection (A, y0, sigma, offset).
+        x_proj: Projection of the image in x.
+        y_proj: Projection of the image in y.
+    """
     p0x = [1.0, x[0], 10.0, 0.0]
     p0y = [1.0, y[0], 10.0, 0.0]
     if previousPx is not None and previousPy is not None:
         p0x = previousPx
         p0y = previousPy
-    x_proj, y_proj, px, py = gaussian_fit_projections(
+    pyramid = False
+    if "pyramid" in config:
+        pyramid = config["pyramid"]
+    result = None
+    if pyramid:
+        result = _pyramid_projections(image, x, y, config, p0x, p0y)
+    if result is None:
+        result = _analyze_projections(image, x, y, config, p0x, p0y, projections)
+    x_proj, y_proj, px, py = result
+    if px is None:
+        px = p0x
+    if py is None:
+        py = p0y
+    centerX = px[1]
+    centerY = py[1]
+    centroid = (centerX, centerY)
+    return centroid, px, py, x_proj, y_proj
+
+
+def trackImageCenter(image, x, y, config, previousPx, previousPy, projections=None):
+    """Finds the center of the beam using only a window around its previous position.
+
+    The window extends config["trackingSigmas"] (default 5) of the previous sigmas on
+    each side of the previous center, so the cost scales with the spot size rather than
+    the sensor size. The full frame is analyzed instead when there is no previous fit,
+    the fit in the window fails, the beam moves near the edge of the window or the beam
+    grows too large for the window. Projections passed in projections are only used for
+    the full frame.
+
+    Returns:
+        centroid: Tuple of the (x, y) center of the beam.
+        px: Parameters for the x projection (A, x0, sigma, offset).
+        py: Parameters for the y projection (A, y0, sigma, offset).
+        x_proj: Projection of the analyzed region in x.
+        y_proj: Projection of the analyzed region in y.
+        window: Index range (iy0, iy1, ix0, ix1) that was analyzed, None for the full frame.
+    """
+    nSigma = 5.0
+    if "trackingSigmas" in config:
+        nSigma = config["trackingSigmas"]
+    if previousPx is not None and previousPy is not None:
+        iy0, iy1, ix0, ix1 = beam_window(x, y, previousPx, previousPy, nSigma)
+        ix = [ix0, ix1]
+        iy = [iy0, iy1]
+        if min(ix[1] - ix[0], iy[1] - iy[0]) >= 8:
+            sub = image[iy[0] : iy[1], ix[0] : ix[1]]
+            xw = x[ix[0] : ix[1]]
+            yw = y[iy[0] : iy[1]]
+            sigmaX = abs(previousPx[2])
+            sigmaY = abs(previousPy[2])
+            x_proj, y_proj, px, py = _analyze_projections(
+                sub, xw, yw, config, previousPx, previousPy
+            )
+            if _in_window(px, x, ix, sigmaX) and _in_window(py, y, iy, sigmaY):
+                centroid = (px[1], py[1])
+                return centroid, px, py, x_proj, y_proj, (iy[0], iy[1], ix[0], ix[1])
+    centroid, px, py, x_proj, y_proj = findImageCenter(
+        image, x, y, config, previousPx, previousPy, projections
+    )
+    return centroid, px, py, x_proj, y_proj, None
+
+
+def block_reduce(image: np.ndarray, factor: int) -> np.ndarray:
+    """Sums the image over blocks of factor x factor pixels.
+
+    Rows and columns that don't fill a complete block are dropped. The rows are summed
+    first so both reductions run over contiguous memory.
+
+    Args:
+        image: 2D array representing image data.
+        factor: Size of the blocks in pixels.
+
+    Returns:
+        reduced: 2D array of the block sums.
+    """
+    Y = image.shape[0] // factor
+    X = image.shape[1] // factor
+    rows = image[: Y * factor, : X * factor].reshape(Y, factor, X * factor)
+    rows = rows.sum(axis=1, dtype="uint32" if image.dtype.kind == "u" else "float")
+    return rows.reshape(Y, X, factor).sum(axis=2)
+
+
+def _pyramid_projections(image, x, y, config, p0x, p0y):
+    """Finds the beam on a reduced image and refines it at full resolution around it.
+
+    config["pyramidFactor"] (default 8) sets the reduction. config["pyramidMethod"] is
+    "sum" (default) to sum over blocks with block_reduce, or "decimate" to only sample
+    every factor-th pixel, which has a cost that barely depends on the frame size but
+    can miss spots smaller than the factor. The full resolution analysis runs on a
+    window of config["pyramidSigmas"] (default 5) coarse sigmas around the coarse center.
+
+    Returns None if the beam couldn't be found on the reduced image or in the window.
+    """
+    factor = 8
+    if "pyramidFactor" in config:
+        factor = config["pyramidFactor"]
+    method = "sum"
+    if "pyramidMethod" in config:
+        method = config["pyramidMethod"]
+    nSigma = 5.0
+    if "pyramidSigmas" in config:
+        nSigma = config["pyramidSigmas"]
+    Y = image.shape[0] // factor
+    X = image.shape[1] // factor
+    if min(X, Y) < 8:
+        return None
+    if method == "decimate":
+        reduced = image[factor // 2 :: factor, factor // 2 :: factor][:Y, :X]
+        xr = x[factor // 2 :: factor][:X]
+        yr = y[factor // 2 :: factor][:Y]
+    else:
+        reduced = block_reduce(image, factor)
+        xr = x[: X * factor].reshape(X, factor).mean(axis=1)
+        yr = y[: Y * factor].reshape(Y, factor).mean(axis=1)
+    x_proj, y_proj, cx, cy = moment_projections(reduced, xr, yr)
+    if cx is None or cy is None:
+        return None
+    # The coarse width can't resolve anything smaller than a block
+    ix = _aperture(x, cx[1], 2 * nSigma * max(cx[2], abs(xr[1] - xr[0])))
+    iy = _aperture(y, cy[1], 2 * nSigma * max(cy[2], abs(yr[1] - yr[0])))
+    sub = image[iy[0] : iy[1], ix[0] : ix[1]]
+    x_proj, y_proj, px, py = _analyze_projections(
+        sub, x[ix[0] : ix[1]], y[iy[0] : iy[1]], config, p0x, p0y
+    )
+    if px is None or py is None:
+        return None
+    return x_proj, y_proj, px, py
+
+
+def beam_window(x, y, px, py, nSigma=5.0):
+    """Returns the index range (iy0, iy1, ix0, ix1) within nSigma sigmas of the beam center.
+
+    Args:
+        x: Center coordinates of each pixel in the x direction.
+        y: Center coordinates of each pixel in the y direction.
+        px: Parameters for the x projection (A, x0, sigma, offset).
+        py: Parameters for the y projection (A, y0, sigma, offset).
+        nSigma: Half width of the window in sigmas, defaults to 5.
+    """
+    ix = _aperture(x, px[1], 2 * nSigma * abs(px[2]))
+    iy = _aperture(y, py[1], 2 * nSigma * abs(py[2]))
+    return iy[0], iy[1], ix[0], ix[1]
+
+
+def _in_window(p, x, index, previousSigma):
+    """Checks that a fit in the window index of x found the beam well inside the window."""
+    if p is None or not np.all(np.isfinite(p)) or p[2] <= 0.0:
+        return False
+    # Let the beam grow a little, a large jump means we are only seeing part of it
+    if abs(p[2]) > 1.5 * previousSigma:
+        return False
+    # The window can't be recentered past the edge of the sensor
+    margin = 2 * abs(p[2])
+    low = x[index[0]] + margin if index[0] > 0 else x[0]
+    high = x[index[1] - 1] - margin if index[1] < len(x) else x[-1]
+    return low <= p[1] <= high
+
+
+def _analyze_projections(image, x, y, config, p0x, p0y, projections=None):
+    """Runs the analysis selected in config, returns None for the parameters of a failed fit."""
+    medianFilter = False
+    if "medianFilter" in config:
+        medianFilter = config["medianFilter"]
+    analysis = "gaussian"
+    if "analysis" in config:
+        analysis = config["analysis"]
+    fastFit = False
+    if "fastFit" in config:
+        fastFit = config["fastFit"]
+    jacobian = False
+    if "jacobian" in config:
+        jacobian = config["jacobian"]
+    fitMethod = "trf"
+    if "fitMethod" in config:
+        fitMethod = config["fitMethod"]
+    if analysis == "moments":
+        return moment_projections(
+            image, x, y, medianFilter=medianFilter, projections=projections
+        )
+    return gaussian_fit_projections(
         image,
         x,
         y,
@@ -137,12 +589,8 @@ def findImageCenter(image, x, y, config, previousPx, previousPy):
         estimateA=True,
         estimateCen=True,
         medianFilter=medianFilter,
+        fastFit=fastFit,
+        jacobian=jacobian,
+        fitMethod=fitMethod,
+        projections=projections,
     )
-    if px is None:
-        px = p0x
-    if py is None:
-        py = p0x
-    centerX = px[1]
-    centerY = py[1]
-    centroid = (centerX, centerY)
-    return centroid, px, py, x_proj, y_proj
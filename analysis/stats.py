@@ -0,0 +1,71 @@
+import numpy as np
+
+# Pixels counted at a time for the histogram, bincount copies them to intp
+HISTOGRAM_CHUNK = 2**16
+
+
+def frame_statistics(
+    image: np.ndarray, saturation=None, nBins: int = 256, histogramPixels: int = 250_000
+) -> dict:
+    """Calculates the statistics of a frame needed by the analysis and the display.
+
+    The projections of unsigned integer images are accumulated in integers of the
+    smallest width that can't overflow, which is faster than accumulating in floats.
+    The total counts come from a projection and the saturated pixels are only counted
+    when the maximum reaches the saturation level, so the only full frame passes are
+    the two projections, the minimum and the maximum. The histogram is only for display,
+    so like pyqtgraph it is calculated from a strided subsample of the frame. Integer
+    samples are counted HISTOGRAM_CHUNK pixels at a time, so the intp copy bincount
+    makes stays small.
+
+    Args:
+        image: 2D array representing image data.
+        saturation: Pixel value at which a pixel is saturated, defaults to the largest
+            value of the image's dtype (or None for float images).
+        nBins: Largest number of bins in the histogram, defaults to 256.
+        histogramPixels: Approximate number of pixels used for the histogram.
+
+    Returns:
+        stats: Dictionary with the x and y projections as floats ("x_proj", "y_proj"),
+            "min", "max", "total", "saturated" and "histogram" (bin centers, counts).
+    """
+    Y, X = image.shape
+    isInt = image.dtype.kind in "ui"
+    if image.dtype.kind == "u":
+        maxValue = int(np.iinfo(image.dtype).max)
+        acc = "uint32" if max(X, Y) * maxValue < 2**32 else "uint64"
+    elif isInt:
+        acc = "int64"
+    else:
+        acc = "float"
+    if saturation is None and image.dtype.kind == "u":
+        saturation = maxValue
+    stats = {}
+    stats["x_proj"] = image.sum(axis=0, dtype=acc).astype("float")
+    stats["y_proj"] = image.sum(axis=1, dtype=acc).astype("float")
+    stats["total"] = stats["y_proj"].sum()
+    stats["min"] = image.min()
+    stats["max"] = image.max()
+    stats["saturated"] = 0
+    if saturation is not None and stats["max"] >= saturation:
+        stats["saturated"] = int(np.count_nonzero(image >= saturation))
+
+    step = max(1, int(np.sqrt(Y * X / histogramPixels)))
+    sample = image[::step, ::step]
+    scale = step**2
+    if isInt and stats["min"] >= 0:
+        counts = np.zeros(int(stats["max"]) + 1, dtype="int64")
+        rows = max(1, HISTOGRAM_CHUNK // sample.shape[1])
+        for i in range(0, sample.shape[0], rows):
+            chunk = sample[i : i + rows].reshape(-1)
+            counts += np.bincount(chunk, minlength=len(counts))
+        # Combine the integer values into at most nBins bins
+        width = -(-len(counts) // nBins)
+        counts = np.pad(counts, (0, -len(counts) % width))
+        counts = counts.reshape(-1, width).sum(axis=1)
+        centers = np.arange(len(counts)) * width + 0.5 * (width - 1)
+    else:
+        counts, edges = np.histogram(sample, bins=nBins)
+        centers = 0.5 * (edges[1:] + edges[:-1])
+    stats["histogram"] = (centers, counts * scale)
+    return stats
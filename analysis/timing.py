@@ -0,0 +1,137 @@
+import csv
+import json
+import time
+
+import numpy as np
+
+
+def stamp(timestamps: list, name: str):
+    """Appends (name, time) to a frame's list of timestamps.
+
+    All stamps use time.perf_counter, which is monotonic and shared by every thread
+    (and on the supported platforms every process), so stamps from the camera
+    callback, the worker and the gui can be subtracted from each other.
+    """
+    timestamps.append((name, time.perf_counter()))
+
+
+class ClockOffset:
+    """Maps camera timestamps onto the host's perf_counter clock.
+
+    The offset is the smallest difference between the host arrival time and the camera
+    timestamp seen so far, so converted times are relative to the fastest transfer
+    observed and camera to host latencies are lower bounds.
+    """
+
+    def __init__(self):
+        self.offset = None
+
+    def update(self, cameraTime: float, hostTime: float):
+        offset = hostTime - cameraTime
+        if self.offset is None or offset < self.offset:
+            self.offset = offset
+
+    def reset(self):
+        self.offset = None
+
+    def to_host(self, cameraTime: float) -> float:
+        return cameraTime + self.offset
+
+
+class RollingHistogram:
+    """Fixed memory record of the last N durations of one stage.
+
+    Args:
+        N: Number of durations kept, older durations are overwritten.
+    """
+
+    def __init__(self, N=1000):
+        self.values = np.zeros(N)
+        self.N = N
+        self.count = 0
+
+    def add(self, value: float):
+        self.values[self.count % self.N] = value
+        self.count += 1
+
+    def recent(self) -> np.ndarray:
+        return self.values[: min(self.count, self.N)]
+
+    def summary(self) -> dict:
+        """Returns the count, mean, median, 95th and 99th percentiles and maximum [s]."""
+        values = self.recent()
+        if len(values) == 0:
+            return {"count": 0}
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {
+            "count": self.count,
+            "mean": float(values.mean()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": float(values.max()),
+        }
+
+    def histogram(self, nBins=50):
+        """Returns the bin edges and counts of the recent durations, in log spaced bins."""
+        values = self.recent()
+        values = values[values > 0]
+        if len(values) == 0:
+            return np.zeros(nBins + 1), np.zeros(nBins, dtype="int")
+        edges = np.geomspace(values.min(), values.max() * 1.000001, nBins + 1)
+        counts, edges = np.histogram(values, bins=edges)
+        return edges, counts
+
+
+class TimingStats:
+    """Rolling histograms of the time each frame spends in each stage of the pipeline.
+
+    Frames carry a list of timestamps, one per stage, and the duration of a stage is the
+    time from the previous timestamp to its own. Stages are kept in the order they are
+    first seen.
+
+    Args:
+        N: Number of durations kept per stage.
+    """
+
+    def __init__(self, N=1000):
+        self.N = N
+        self.stages = {}
+
+    def add(self, name: str, duration: float):
+        if name not in self.stages:
+            self.stages[name] = RollingHistogram(self.N)
+        self.stages[name].add(duration)
+
+    def add_timestamps(self, timestamps: list):
+        """Adds the duration of every stage in a frame's list of timestamps."""
+        for (previous, t0), (name, t1) in zip(timestamps[:-1], timestamps[1:]):
+            self.add(name, t1 - t0)
+
+    def reset(self):
+        self.stages = {}
+
+    def summary(self) -> dict:
+        return {name: hist.summary() for name, hist in self.stages.items()}
+
+    def save_csv(self, path):
+        """Saves the summary of each stage, one row per stage, durations in ms."""
+        columns = ["count", "mean", "p50", "p95", "p99", "max"]
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            header = ["stage", "count"] + [c + " [ms]" for c in columns[1:]]
+            writer.writerow(header)
+            for name, summary in self.summary().items():
+                row = [name, summary["count"]]
+                for c in columns[1:]:
+                    row.append(1e3 * summary[c] if c in summary else "")
+                writer.writerow(row)
+
+    def save_json(self, path):
+        """Saves the summary and recent durations of each stage, durations in s."""
+        output = {}
+        for name, hist in self.stages.items():
+            output[name] = hist.summary()
+            output[name]["recent"] = hist.recent().tolist()
+        with open(path, "w") as f:
+            json.dump(output, f, indent=2)
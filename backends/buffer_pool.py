@@ -0,0 +1,68 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class BufferPool:
+    """Fixed size frame buffers that are reused instead of allocating every frame.
+
+    The camera copies each frame into a buffer from acquire() and whoever is done with
+    the frame last (usually the gui once a newer frame is displayed) hands it back with
+    release(). All of the buffers have the frame size and dtype the pool was last
+    configured for, when the ROI, binning or pixel format changes the pool is rebuilt
+    and buffers of the old size are simply not taken back. Buffers are only allocated
+    when acquire() finds none free, so a pool sized for the worst case costs no more
+    memory than the frames actually in flight. Once nBuffers are in use acquire()
+    returns None and the caller falls back to allocating a new array or drops the frame.
+
+    Args:
+        nBuffers: Largest number of buffers, enough for every frame that can be in
+            flight.
+    """
+
+    def __init__(self, nBuffers=8):
+        self.nBuffers = nBuffers
+        self._lock = threading.Lock()
+        self.shape = None
+        self.dtype = None
+        self._buffers = {}
+        self._free = deque()
+        self.misses = 0
+
+    def configure(self, shape, dtype):
+        """Sets the shape and dtype of the buffers, dropping buffers of another size."""
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        with self._lock:
+            if shape == self.shape and dtype == self.dtype:
+                return
+            self.shape = shape
+            self.dtype = dtype
+            self._buffers = {}
+            self._free = deque()
+            self.misses = 0
+
+    def acquire(self, shape, dtype):
+        """Returns a free buffer for a frame, None if all of them are in use."""
+        if tuple(shape) != self.shape or np.dtype(dtype) != self.dtype:
+            self.configure(shape, dtype)
+        with self._lock:
+            if len(self._free) > 0:
+                return self._free.popleft()
+            if len(self._buffers) >= self.nBuffers:
+                self.misses += 1
+                return None
+            buffer = np.empty(self.shape, self.dtype)
+            self._buffers[id(buffer)] = buffer
+            return buffer
+
+    def release(self, buffer):
+        """Hands a buffer back, anything that isn't a buffer in use is ignored."""
+        with self._lock:
+            if self._buffers.get(id(buffer)) is not buffer:
+                return
+            # Releasing twice would hand the same buffer to two frames
+            if any(free is buffer for free in self._free):
+                return
+            self._free.append(buffer)
@@ -1,22 +1,138 @@
+import threading
+import time
+from collections import deque
+
 import numpy as np
 from pypylon import genicam, pylon
 from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
 
+import analysis.timing as timing
+from backends import buffer_pool, mailbox
 from interfaces import camera_interface
 
 
 class ImageEventHandler(QObject, pylon.ImageEventHandler):
-    imageGrabbedSignal = pyqtSignal(dict)
+    frameReadySignal = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self.bufferPool = buffer_pool.BufferPool()
+        self.mailbox = mailbox.FrameMailbox(
+            lambda frame: self.bufferPool.release(frame["image"])
+        )
+        # Ticks per second of the camera's timestamp counter
+        self.tickFrequency = 1e9
+        self.reset_counters()
+        self._offsetLock = threading.Lock()
+        self.reset_offsets(0, 0)
+
+    def reset_counters(self):
+        self.lastFrameId = None
+        self.skipped = 0
+        self.lost = 0
+
+    def reset_offsets(self, offsetX, offsetY):
+        """Sets the ROI offsets of every frame from now on, call while not grabbing."""
+        with self._offsetLock:
+            # (camera time [s] the offsets apply from, offsetX, offsetY), oldest first
+            self.offsets = deque([(-np.inf, offsetX, offsetY)])
+
+    def offsets_changed(self, cameraTime, offsetX, offsetY):
+        """Frames exposed from cameraTime [s] on have the new offsets.
+
+        Frames that were exposed before the offsets were written can still be on their
+        way. If the camera's time is unknown (None), the offsets apply from the next
+        frame grabbed.
+        """
+        with self._offsetLock:
+            self.offsets.append((cameraTime, offsetX, offsetY))
+
+    def _frame_offsets(self, cameraTime):
+        with self._offsetLock:
+            offsets = self.offsets
+            while len(offsets) > 1 and (
+                offsets[1][0] is None or offsets[1][0] <= cameraTime
+            ):
+                offsets.popleft()
+            return offsets[0][1:]
+
+    def OnImagesSkipped(self, camera, countOfSkippedImages):
+        # Images the grab strategy threw away before they reached us
+        self.skipped += countOfSkippedImages
 
     def OnImageGrabbed(self, camera, grabResult):
         if grabResult.GrabSucceeded():
-            data = {"image": grabResult.GetArray()}
-            self.imageGrabbedSignal.emit(data)
+            timestamps = []
+            timing.stamp(timestamps, "grab")
+            metadata = self.frame_metadata(grabResult)
+            # Copy straight from the grab buffer into a pooled frame, the grab buffer
+            # goes back to pylon when this returns
+            with grabResult.GetArrayZeroCopy() as array:
+                image = self.bufferPool.acquire(array.shape, array.dtype)
+                if image is None:
+                    image = array.copy()
+                else:
+                    np.copyto(image, array)
+            timing.stamp(timestamps, "copy")
+            data = {"image": image, "timestamps": timestamps, "metadata": metadata}
+            # Only notify when the mailbox was empty, so notifications can't pile up
+            if self.mailbox.put(data):
+                self.frameReadySignal.emit()
         else:
             print(
                 "Error: ", grabResult.GetErrorCode(), grabResult.GetErrorDescription()
             )
 
+    def frame_metadata(self, grabResult):
+        """Returns the frame id, the camera and host times, the loss counters and offsets."""
+        frameId = grabResult.GetBlockID()
+        # Gaps in the block ids are frames lost on the way from the camera, the ids
+        # of GigE cameras wrap around so only count gaps going forward
+        if self.lastFrameId is not None and frameId > self.lastFrameId + 1:
+            self.lost += frameId - self.lastFrameId - 1
+        self.lastFrameId = frameId
+        cameraTime = grabResult.GetTimeStamp() / self.tickFrequency
+        offsetX, offsetY = self._frame_offsets(cameraTime)
+        return {
+            "frame_id": frameId,
+            "camera_timestamp": cameraTime,
+            "host_time": time.time(),
+            "skipped": self.skipped,
+            "lost": self.lost,
+            "offsetX": offsetX,
+            "offsetY": offsetY,
+        }
+
+
+# Node attributes read into the cache in one pass when the camera is connected
+CACHED_ATTRIBUTES = {
+    "ExposureTime": ("Value", "Min", "Max"),
+    "Gain": ("Value", "Min", "Max"),
+    "Width": ("Value", "Min", "Max"),
+    "Height": ("Value", "Min", "Max"),
+    "OffsetX": ("Value", "Min", "Max"),
+    "OffsetY": ("Value", "Min", "Max"),
+    "ExposureMode": ("Value", "Symbolics"),
+    "TriggerMode": ("Value", "Symbolics"),
+    "TriggerSource": ("Value", "Symbolics"),
+    "PixelFormat": ("Value", "Symbolics"),
+    "BinningHorizontal": ("Value", "Min", "Max"),
+    "BinningVertical": ("Value", "Min", "Max"),
+    "BinningHorizontalMode": ("Value", "Symbolics"),
+    "BinningVerticalMode": ("Value", "Symbolics"),
+}
+# Nodes whose value or range follows another node, dropped from the cache with it even
+# if the camera doesn't report the change on the dependent node
+DEPENDENT_NODES = {
+    "Width": ["OffsetX"],
+    "Height": ["OffsetY"],
+    # The largest size shrinks as the offset grows
+    "OffsetX": ["Width"],
+    "OffsetY": ["Height"],
+    "BinningHorizontal": ["Width", "OffsetX"],
+    "BinningVertical": ["Height", "OffsetY"],
+}
+
 
 class Basler(QObject):
     # class Basler(camera_interface.Camera, QObject):
@@ -28,7 +144,7 @@ class Basler(QObject):
     offsetY_changed = pyqtSignal(int)
     binning_horizontal_changed = pyqtSignal(int)
     binning_vertical_changed = pyqtSignal(int)
-    image_grabbed = pyqtSignal(dict)
+    frame_ready = pyqtSignal()
 
     def __init__(self, serial_number):
         super().__init__()
@@ -41,6 +157,12 @@ class Basler(QObject):
         camera = pylon.InstantCamera(tlFactory.CreateDevice(info))
         camera.Open()
         self.camera = camera
+        # Every read is a round trip to the camera, so values are served from memory
+        # and dropped when GenICam reports a change. The cache is emptied before the
+        # callbacks below run, so they and the slots they call read the new values.
+        self._cache = {}
+        for name in CACHED_ATTRIBUTES:
+            genicam.Register(getattr(camera, name).GetNode(), self._on_node_change)
         genicam.Register(camera.ExposureTime.GetNode(), self._on_exposure_change)
         genicam.Register(camera.Gain.GetNode(), self._on_gain_change)
         genicam.Register(camera.Width.GetNode(), self._on_width_change)
@@ -54,17 +176,65 @@ class Basler(QObject):
             camera.BinningVertical.GetNode(), self._on_binning_vertical_change
         )
         self.eventHandler = ImageEventHandler()
-        self.image_grabbed = self.eventHandler.imageGrabbedSignal
+        self.frame_ready = self.eventHandler.frameReadySignal
+        self.mailbox = self.eventHandler.mailbox
+        self.bufferPool = self.eventHandler.bufferPool
+        # GigE cameras count in ticks of their own frequency, USB cameras in ns
+        try:
+            self.eventHandler.tickFrequency = camera.GevTimestampTickFrequency.Value
+        except (genicam.GenericException, AttributeError):
+            pass
         camera.RegisterImageEventHandler(
             self.eventHandler,
             pylon.RegistrationMode_Append,
             pylon.Cleanup_Delete,
         )
+        self.fill_cache()
 
     def close(self):
         self.camera.Close()
+        self._cache = {}
+
+    # Parameter cache
+    # -----------------------------------------------------------------
+    def fill_cache(self):
+        """Reads every cached node attribute in a single pass."""
+        for name, attributes in CACHED_ATTRIBUTES.items():
+            for attribute in attributes:
+                try:
+                    self._get(name, attribute)
+                except (genicam.GenericException, AttributeError):
+                    # Left for the getter to report if it is ever used
+                    pass
+
+    def _get(self, name, attribute="Value"):
+        """Returns an attribute of a camera node, read from the camera on a cache miss."""
+        values = self._cache.setdefault(name, {})
+        if attribute not in values:
+            values[attribute] = getattr(getattr(self.camera, name), attribute)
+        return values[attribute]
+
+    def _invalidate(self, name):
+        self._cache.pop(name, None)
+        for dependent in DEPENDENT_NODES.get(name, []):
+            self._cache.pop(dependent, None)
+
+    def _on_node_change(self, node):
+        try:
+            name = node.GetName()
+        except genicam.GenericException:
+            # Without the name the entry can't be found, start over
+            self._cache = {}
+            return
+        self._invalidate(name)
 
     def start_streaming(self):
+        self.mailbox.clear()
+        self.eventHandler.reset_counters()
+        self.eventHandler.reset_offsets(self.get_offsetX(), self.get_offsetY())
+        self.bufferPool.configure(
+            (self.get_height(), self.get_width()), self._frame_dtype()
+        )
         self.camera.StartGrabbing(
             pylon.GrabStrategy_OneByOne, pylon.GrabLoop_ProvidedByInstantCamera
         )
@@ -73,6 +243,12 @@ class Basler(QObject):
         print("Stop grabbing")
         self.camera.StopGrabbing()
 
+    def _frame_dtype(self):
+        # GetArray unpacks every format deeper than 8 bits to 16 bit pixels
+        if self.get_pixel_format().endswith("8"):
+            return "uint8"
+        return "uint16"
+
     # XXX Should not be used when using the grabbing thread
     # def get_image(self):
     #     # Use a 10sec timeout
@@ -93,12 +269,12 @@ class Basler(QObject):
 
     def get_exposure(self):
         """Returns the camera's expsoure time [ms]."""
-        return self.camera.ExposureTime.Value * 1.0e-3
+        return self._get("ExposureTime") * 1.0e-3
 
     def get_exposure_range(self):
         return [
-            self.camera.ExposureTime.Min * 1.0e-3,
-            self.camera.ExposureTime.Max * 1.0e-3,
+            self._get("ExposureTime", "Min") * 1.0e-3,
+            self._get("ExposureTime", "Max") * 1.0e-3,
         ]
 
     def _on_exposure_change(self, update):
@@ -114,12 +290,12 @@ class Basler(QObject):
 
     def get_gain(self):
         """Returns the camera's gain [dB]."""
-        return self.camera.Gain.Value
+        return self._get("Gain")
 
     def get_gain_range(self):
         return [
-            self.camera.Gain.Min,
-            self.camera.Gain.Max,
+            self._get("Gain", "Min"),
+            self._get("Gain", "Max"),
         ]
 
     def _on_gain_change(self, update):
@@ -135,12 +311,12 @@ class Basler(QObject):
 
     def get_width(self):
         """Returns the camera's ROI width [px]."""
-        return self.camera.Width.Value
+        return self._get("Width")
 
     def get_width_range(self):
         return [
-            self.camera.Width.Min,
-            self.camera.Width.Max,
+            self._get("Width", "Min"),
+            self._get("Width", "Max"),
         ]
 
     def _on_width_change(self, update):
@@ -156,12 +332,12 @@ class Basler(QObject):
 
     def get_height(self):
         """Returns the camera's ROI height [px]."""
-        return self.camera.Height.Value
+        return self._get("Height")
 
     def get_height_range(self):
         return [
-            self.camera.Height.Min,
-            self.camera.Height.Max,
+            self._get("Height", "Min"),
+            self._get("Height", "Max"),
         ]
 
     def _on_height_change(self, update):
@@ -174,15 +350,16 @@ class Basler(QObject):
     # -----------------------------------------------------------------
     def set_offsetX(self, value):
         self.camera.OffsetX.Value = value
+        self._offsets_changed()
 
     def get_offsetX(self):
         """Returns the camera's ROI width [px]."""
-        return self.camera.OffsetX.Value
+        return self._get("OffsetX")
 
     def get_offsetX_range(self):
         return [
-            self.camera.OffsetX.Min,
-            self.camera.OffsetX.Max,
+            self._get("OffsetX", "Min"),
+            self._get("OffsetX", "Max"),
         ]
 
     def _on_offsetX_change(self, update):
@@ -195,15 +372,42 @@ class Basler(QObject):
     # -----------------------------------------------------------------
     def set_offsetY(self, value):
         self.camera.OffsetY.Value = value
+        self._offsets_changed()
+
+    def _offsets_changed(self):
+        """Tells the event handler which frames are exposed with the new offsets.
+
+        The offsets can be written while grabbing, but the frames already exposed still
+        have the old ones, so the change is tagged with the camera's time.
+        """
+        self.eventHandler.offsets_changed(
+            self._camera_time(), self.get_offsetX(), self.get_offsetY()
+        )
+
+    def _camera_time(self):
+        """Returns the time of the camera's timestamp counter [s], None if unknown."""
+        camera = self.camera
+        # USB cameras latch the counter with TimestampLatch, GigE cameras with
+        # GevTimestampControlLatch
+        try:
+            camera.TimestampLatch.Execute()
+            return camera.TimestampLatchValue.Value / self.eventHandler.tickFrequency
+        except (genicam.GenericException, AttributeError):
+            pass
+        try:
+            camera.GevTimestampControlLatch.Execute()
+            return camera.GevTimestampValue.Value / self.eventHandler.tickFrequency
+        except (genicam.GenericException, AttributeError):
+            return None
 
     def get_offsetY(self):
         """Returns the camera's ROI width [px]."""
-        return self.camera.OffsetY.Value
+        return self._get("OffsetY")
 
     def get_offsetY_range(self):
         return [
-            self.camera.OffsetY.Min,
-            self.camera.OffsetY.Max,
+            self._get("OffsetY", "Min"),
+            self._get("OffsetY", "Max"),
         ]
 
     def _on_offsetY_change(self, update):
@@ -218,10 +422,10 @@ class Basler(QObject):
         self.camera.ExposureMode.Value = value
 
     def get_exposure_mode(self):
-        return self.camera.ExposureMode.Value
+        return self._get("ExposureMode")
 
     def enumerate_exposure_mode(self):
-        return self.camera.ExposureMode.Symbolics
+        return self._get("ExposureMode", "Symbolics")
 
     # Trigger Mode
     # -----------------------------------------------------------------
@@ -229,10 +433,10 @@ class Basler(QObject):
         self.camera.TriggerMode.Value = value
 
     def get_trigger_mode(self):
-        return self.camera.TriggerMode.Value
+        return self._get("TriggerMode")
 
     def enumerate_trigger_mode(self):
-        return self.camera.TriggerMode.Symbolics
+        return self._get("TriggerMode", "Symbolics")
 
     # Trigger Source
     # -----------------------------------------------------------------
@@ -240,10 +444,10 @@ class Basler(QObject):
         self.camera.TriggerSource.Value = value
 
     def get_trigger_source(self):
-        return self.camera.TriggerSource.Value
+        return self._get("TriggerSource")
 
     def enumerate_trigger_source(self):
-        return self.camera.TriggerSource.Symbolics
+        return self._get("TriggerSource", "Symbolics")
 
     # Pixel Format
     # -----------------------------------------------------------------
@@ -251,10 +455,10 @@ class Basler(QObject):
         self.camera.PixelFormat.Value = value
 
     def get_pixel_format(self):
-        return self.camera.PixelFormat.Value
+        return self._get("PixelFormat")
 
     def enumerate_pixel_format(self):
-        return self.camera.PixelFormat.Symbolics
+        return self._get("PixelFormat", "Symbolics")
 
     # Binning Horizontal
     # -----------------------------------------------------------------
@@ -262,12 +466,12 @@ class Basler(QObject):
         self.camera.BinningHorizontal.Value = value
 
     def get_binning_horizontal(self):
-        return self.camera.BinningHorizontal.Value
+        return self._get("BinningHorizontal")
 
     def get_binning_horizontal_range(self):
         return [
-            self.camera.BinningHorizontal.Min,
-            self.camera.BinningHorizontal.Max,
+            self._get("BinningHorizontal", "Min"),
+            self._get("BinningHorizontal", "Max"),
         ]
 
     def _on_binning_horizontal_change(self, update):
@@ -282,12 +486,12 @@ class Basler(QObject):
         self.camera.BinningVertical.Value = value
 
     def get_binning_vertical(self):
-        return self.camera.BinningVertical.Value
+        return self._get("BinningVertical")
 
     def get_binning_vertical_range(self):
         return [
-            self.camera.BinningVertical.Min,
-            self.camera.BinningVertical.Max,
+            self._get("BinningVertical", "Min"),
+            self._get("BinningVertical", "Max"),
         ]
 
     def _on_binning_vertical_change(self, update):
@@ -302,10 +506,10 @@ class Basler(QObject):
         self.camera.BinningHorizontalMode.Value = value
 
     def get_binning_horizontal_mode(self):
-        return self.camera.BinningHorizontalMode.Value
+        return self._get("BinningHorizontalMode")
 
     def enumerate_binning_horizontal_mode(self):
-        return self.camera.BinningHorizontalMode.Symbolics
+        return self._get("BinningHorizontalMode", "Symbolics")
 
     # Binning Vertical Mode
     # -----------------------------------------------------------------
@@ -313,7 +517,7 @@ class Basler(QObject):
         self.camera.BinningVerticalMode.Value = value
 
     def get_binning_vertical_mode(self):
-        return self.camera.BinningVerticalMode.Value
+        return self._get("BinningVerticalMode")
 
     def enumerate_binning_vertical_mode(self):
-        return self.camera.BinningVerticalMode.Symbolics
+        return self._get("BinningVerticalMode", "Symbolics")
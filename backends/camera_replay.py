@@ -0,0 +1,401 @@
+import csv
+import queue
+import threading
+import time
+
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal
+
+import analysis.timing as timing
+from backends import buffer_pool, mailbox, recorder
+
+
+def load_recording(path):
+    """Opens a recording made by backends.recorder without reading the frames.
+
+    Returns:
+        frames: (N, height, width) memory map (or HDF5 dataset) of the frames.
+        index: Structured array of recorder.INDEX_DTYPE with the metadata of each frame.
+    """
+    if path.endswith((".h5", ".hdf5")):
+        if recorder.h5py is None:
+            raise ImportError("Replaying HDF5 recordings requires h5py")
+        f = recorder.h5py.File(path, "r")
+        return f["frames"], f["index"][...]
+    frames = np.load(path, mmap_mode="r")
+    rows = []
+    try:
+        with open(recorder.index_path(path), newline="") as f:
+            for row in csv.DictReader(f):
+                rows.append(tuple(float(row[name]) for name in recorder.INDEX_FIELDS))
+    except OSError:
+        pass
+    index = np.array(rows, dtype=recorder.INDEX_DTYPE)
+    if len(index) < len(frames):
+        # Without an index the frames are numbered and played at 10 fps
+        missing = np.zeros(len(frames) - len(index), dtype=recorder.INDEX_DTYPE)
+        for name in recorder.INDEX_FIELDS[1:]:
+            missing[name] = np.nan
+        missing["frame_id"] = np.arange(len(index), len(frames))
+        index = np.concatenate([index, missing])
+    return frames, index
+
+
+def frame_times(index, defaultPeriod=0.1):
+    """Returns the time of each frame relative to the first from the recorded clocks."""
+    for name in ("camera_timestamp", "host_time"):
+        times = index[name]
+        if len(times) > 0 and np.all(np.isfinite(times)):
+            return times - times[0]
+    return np.arange(len(index)) * defaultPeriod
+
+
+class Replay(QObject):
+    """Camera that plays back a recording made with backends.recorder.
+
+    The frames are served from a memory map. A reader thread copies the next few frames
+    out of the map (reading them from disk) ahead of when they are due and a pacer
+    thread hands them to the worker at the recorded frame times divided by speed. With
+    speed = 0 the frames are played as fast as the analysis takes them, without drops.
+
+    The ROI (width, height and offsets) crops the recorded frames in software, the
+    offsets keep the coordinates of the original sensor. The binning is the recorded
+    binning and can't be changed.
+
+    Args:
+        serial_number: Path of the recording, it takes the place of the serial number.
+    """
+
+    exposure_changed = pyqtSignal(float)
+    gain_changed = pyqtSignal(float)
+    width_changed = pyqtSignal(int)
+    height_changed = pyqtSignal(int)
+    offsetX_changed = pyqtSignal(int)
+    offsetY_changed = pyqtSignal(int)
+    binning_horizontal_changed = pyqtSignal(int)
+    binning_vertical_changed = pyqtSignal(int)
+    frame_ready = pyqtSignal()
+
+    def __init__(self, serial_number):
+        super().__init__()
+        self.path = str(serial_number)
+        self.frames, self.index = load_recording(self.path)
+        if len(self.frames) == 0:
+            raise ValueError(f"{self.path} doesn't contain any frames")
+        self.times = frame_times(self.index)
+        self._sensorHeight, self._sensorWidth = self.frames.shape[1:]
+        self._recordedOffsetX = self._index_value("sx", 0, 0)
+        self._recordedOffsetY = self._index_value("sy", 0, 0)
+        self._exposure = 1.0
+        self._gain = 0.0
+        self._width = self._sensorWidth
+        self._height = self._sensorHeight
+        self._cropX = 0
+        self._cropY = 0
+        self._exposureMode = "None"
+        self._triggerMode = "None"
+        self._triggerSource = "None"
+        self._pixelFormat = "Mono{}".format(8 * self.frames.dtype.itemsize)
+        self._binning_horizontal = self._index_value("scalex", 0, 1)
+        self._binning_vertical = self._index_value("scaley", 0, 1)
+        self._binning_horizontal_mode = "Sum"
+        self._binning_vertical_mode = "Sum"
+        # Playback speed relative to the recording, 0 for as fast as possible
+        self.speed = 1.0
+        self.loop = True
+        self.readAhead = 4
+        self.position = 0
+        self.threads = []
+        self._stop = threading.Event()
+        self.bufferPool = buffer_pool.BufferPool(self.readAhead + 8)
+        self.mailbox = mailbox.FrameMailbox(
+            lambda frame: self.bufferPool.release(frame["image"])
+        )
+
+    def _index_value(self, name, i, default):
+        value = self.index[name][i]
+        return int(value) if np.isfinite(value) else default
+
+    def close(self):
+        self.stop_streaming()
+
+    def start_streaming(self):
+        self.stop_streaming()
+        self.mailbox.clear()
+        self._stop.clear()
+        upcoming = queue.Queue(self.readAhead)
+        self.threads = [
+            threading.Thread(target=self._read, args=(upcoming,), daemon=True),
+            threading.Thread(target=self._pace, args=(upcoming,), daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop_streaming(self):
+        self._stop.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def set_speed(self, value):
+        """Sets the playback speed relative to the recording, 0 for as fast as possible."""
+        self.speed = value
+
+    def _read(self, upcoming):
+        # Copying the frame out of the memory map is what reads it from disk
+        i = self.position
+        while not self._stop.is_set():
+            if i >= len(self.frames):
+                if not self.loop:
+                    self._put(upcoming, None)
+                    return
+                i = 0
+            y0, x0 = self._cropY, self._cropX
+            crop = self.frames[i, y0 : y0 + self._height, x0 : x0 + self._width]
+            image = self.bufferPool.acquire(crop.shape, crop.dtype)
+            if image is None:
+                image = np.empty(crop.shape, crop.dtype)
+            image[...] = crop
+            if not self._put(upcoming, (i, image, x0, y0)):
+                self.bufferPool.release(image)
+            i += 1
+
+    def _put(self, upcoming, item):
+        # Wait for room in the queue, but not past stop_streaming
+        while not self._stop.is_set():
+            try:
+                upcoming.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _pace(self, upcoming):
+        period = np.mean(np.diff(self.times)) if len(self.times) > 1 else 0.1
+        duration = self.times[-1] + period
+        speed = None
+        loops = 0
+        previous = None
+        offsets = (None, None)
+        while not self._stop.is_set():
+            try:
+                item = upcoming.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            i, image, x0, y0 = item
+            if previous is not None and i < previous:
+                loops += 1
+            previous = i
+            recordedTime = self.times[i] + loops * duration
+            if self.speed != speed:
+                # Restart the clock from this frame when the speed changes
+                speed = self.speed
+                start = time.perf_counter() - recordedTime / max(speed, 1e-9)
+            if speed > 0:
+                due = start + recordedTime / speed
+                self._stop.wait(max(0.0, due - time.perf_counter()))
+            elif not self.mailbox.wait_until_empty(timeout=1.0):
+                self.bufferPool.release(image)
+                continue
+            if self._stop.is_set():
+                self.bufferPool.release(image)
+                return
+            offsets = self._emit_offsets(i, x0, y0, offsets)
+            self.position = i
+            timestamps = []
+            timing.stamp(timestamps, "grab")
+            metadata = {
+                "frame_id": int(self.index["frame_id"][i]),
+                "camera_timestamp": recordedTime,
+                "host_time": time.time(),
+                "skipped": 0,
+                "lost": 0,
+                "offsetX": offsets[0],
+                "offsetY": offsets[1],
+            }
+            data = {"image": image, "timestamps": timestamps, "metadata": metadata}
+            # Only notify when the mailbox was empty, so notifications can't pile up
+            if self.mailbox.put(data):
+                self.frame_ready.emit()
+
+    def _emit_offsets(self, i, x0, y0, offsets):
+        # The offsets can change during a recording, tell the worker before the frame
+        sx = self._index_value("sx", i, self._recordedOffsetX) + x0
+        sy = self._index_value("sy", i, self._recordedOffsetY) + y0
+        if sx != offsets[0]:
+            self.offsetX_changed.emit(sx)
+        if sy != offsets[1]:
+            self.offsetY_changed.emit(sy)
+        return sx, sy
+
+    # Exposure
+    # -----------------------------------------------------------------
+    def set_exposure(self, value):
+        self._exposure = value
+
+    def get_exposure(self):
+        """Returns the camera's expsoure time [ms]."""
+        return self._exposure
+
+    def get_exposure_range(self):
+        return [0.001, 1000.00]
+
+    # Gain
+    # -----------------------------------------------------------------
+    def set_gain(self, value):
+        self._gain = value
+
+    def get_gain(self):
+        """Returns the camera's gain [dB]."""
+        return self._gain
+
+    def get_gain_range(self):
+        return [0.0, 48.0]
+
+    # Width
+    # -----------------------------------------------------------------
+    def set_width(self, value):
+        self._width = min(value, self._sensorWidth - self._cropX)
+
+    def get_width(self):
+        """Returns the camera's ROI width [px]."""
+        return self._width
+
+    def get_width_range(self):
+        return [4, self._sensorWidth]
+
+    # Height
+    # -----------------------------------------------------------------
+    def set_height(self, value):
+        self._height = min(value, self._sensorHeight - self._cropY)
+
+    def get_height(self):
+        """Returns the camera's ROI height [px]."""
+        return self._height
+
+    def get_height_range(self):
+        return [4, self._sensorHeight]
+
+    # Offset X
+    # -----------------------------------------------------------------
+    def set_offsetX(self, value):
+        low, high = self.get_offsetX_range()
+        value = min(max(value, low), high)
+        self._cropX = value - self._recordedOffsetX
+        self.offsetX_changed.emit(value)
+
+    def get_offsetX(self):
+        """Returns the camera's ROI x offset [px]."""
+        return self._recordedOffsetX + self._cropX
+
+    def get_offsetX_range(self):
+        low = self._recordedOffsetX
+        return [low, low + self._sensorWidth - self._width]
+
+    # Offset Y
+    # -----------------------------------------------------------------
+    def set_offsetY(self, value):
+        low, high = self.get_offsetY_range()
+        value = min(max(value, low), high)
+        self._cropY = value - self._recordedOffsetY
+        self.offsetY_changed.emit(value)
+
+    def get_offsetY(self):
+        """Returns the camera's ROI y offset [px]."""
+        return self._recordedOffsetY + self._cropY
+
+    def get_offsetY_range(self):
+        low = self._recordedOffsetY
+        return [low, low + self._sensorHeight - self._height]
+
+    # Exposure Mode
+    # -----------------------------------------------------------------
+    def set_exposure_mode(self, value):
+        self._exposureMode = value
+
+    def get_exposure_mode(self):
+        return self._exposureMode
+
+    def enumerate_exposure_mode(self):
+        return ["None"]
+
+    # Trigger Mode
+    # -----------------------------------------------------------------
+    def set_trigger_mode(self, value):
+        self._triggerMode = value
+
+    def get_trigger_mode(self):
+        return self._triggerMode
+
+    def enumerate_trigger_mode(self):
+        return ["None"]
+
+    # Trigger Source
+    # -----------------------------------------------------------------
+    def set_trigger_source(self, value):
+        self._triggerSource = value
+
+    def get_trigger_source(self):
+        return self._triggerSource
+
+    def enumerate_trigger_source(self):
+        return ["None"]
+
+    # Pixel Format
+    # -----------------------------------------------------------------
+    def set_pixel_format(self, value):
+        # The pixel format is the format of the recording
+        pass
+
+    def get_pixel_format(self):
+        return self._pixelFormat
+
+    def enumerate_pixel_format(self):
+        return [self._pixelFormat]
+
+    # Binning Horizontal
+    # -----------------------------------------------------------------
+    def set_binning_horizontal(self, value):
+        # Recorded frames can't be rebinned, report the recorded binning back
+        self.binning_horizontal_changed.emit(self._binning_horizontal)
+
+    def get_binning_horizontal(self):
+        return self._binning_horizontal
+
+    def get_binning_horizontal_range(self):
+        return [self._binning_horizontal, self._binning_horizontal]
+
+    # Binning Vertical
+    # -----------------------------------------------------------------
+    def set_binning_vertical(self, value):
+        self.binning_vertical_changed.emit(self._binning_vertical)
+
+    def get_binning_vertical(self):
+        return self._binning_vertical
+
+    def get_binning_vertical_range(self):
+        return [self._binning_vertical, self._binning_vertical]
+
+    # Binning Horizontal Mode
+    # -----------------------------------------------------------------
+    def set_binning_horizontal_mode(self, value):
+        self._binning_horizontal_mode = value
+
+    def get_binning_horizontal_mode(self):
+        return self._binning_horizontal_mode
+
+    def enumerate_binning_horizontal_mode(self):
+        return ["Sum"]
+
+    # Binning Vertical Mode
+    # -----------------------------------------------------------------
+    def set_binning_vertical_mode(self, value):
+        self._binning_vertical_mode = value
+
+    def get_binning_vertical_mode(self):
+        return self._binning_vertical_mode
+
+    def enumerate_binning_vertical_mode(self):
+        return ["Sum"]
@@ -1,45 +1,236 @@
 import time
 
 import numpy as np
-from PyQt6.QtCore import QObject, QThread, QTimer, pyqtSignal, pyqtSlot
+from PyQt6.QtCore import QObject, Qt, QThread, QTimer, pyqtSignal, pyqtSlot
 
+import analysis.timing as timing
+import config
+from backends import buffer_pool, mailbox
 from interfaces import camera_interface
 
+# Size of the emulated sensor [px]
+SENSOR_WIDTH = 1024
+SENSOR_HEIGHT = 1024
+
+# Options every scenario starts from
+DEFAULT_SCENARIO = {
+    # Beam center on the sensor [px]
+    "center": (600.0, 400.0),
+    "sigma": 50.0,
+    # Peak as a fraction of full scale at 1 ms exposure and 0 dB gain
+    "amplitude": 0.75,
+    # Mean background as a fraction of full scale
+    "background": 0.01,
+    # Standard deviation of the frame to frame beam jitter [px]
+    "jitter": 2.0,
+    # Radius of the circle the beam drifts around and frames per lap [px]
+    "drift": 0.0,
+    "driftPeriod": 300,
+    # Number of pixels stuck at full scale
+    "hotPixels": 0,
+    # Extra spots as (dx, dy, relative amplitude) from the beam
+    "spots": [],
+    # Frames without beam out of every lossPeriod frames
+    "beamLoss": 0,
+    "lossPeriod": 100,
+}
+SCENARIOS = {
+    "jitter": {},
+    "drift": {"drift": 150.0, "jitter": 0.5},
+    "hot pixels": {"hotPixels": 50},
+    "saturation": {"amplitude": 1.5},
+    "multiple spots": {"spots": [(-250.0, 150.0, 0.6), (200.0, -250.0, 0.3)]},
+    "beam loss": {"beamLoss": 20},
+}
+
+
+class FrameSynthesizer:
+    """Draws the frames of a scenario, Gaussian spots on a noisy background.
+
+    The background is copied from a pool of noise frames drawn once, and the spot is
+    the outer product of two 1D Gaussians, only computed where it adds at least half a
+    count. Everything random comes from generators seeded with seed, so the nth frame
+    of a scenario is the same on every run.
+
+    Args:
+        scenario: Name of the scenario in SCENARIOS.
+        seed: Seed of the random numbers.
+        poolSize: Number of noise frames the background is taken from.
+        shape: (height, width) of the sensor [px].
+    """
+
+    def __init__(
+        self, scenario="jitter", seed=0, poolSize=8, shape=(SENSOR_HEIGHT, SENSOR_WIDTH)
+    ):
+        self.options = dict(DEFAULT_SCENARIO)
+        self.options.update(SCENARIOS[scenario])
+        self.scenario = scenario
+        self.seed = seed
+        self.poolSize = poolSize
+        self.shape = tuple(shape)
+        self.noisePool = None
+        self.noiseKey = None
+        self.reset()
+
+    def reset(self):
+        """Starts the scenario over from its first frame."""
+        self.rng = np.random.default_rng(self.seed)
+        self.index = 0
+        nHot = self.options["hotPixels"]
+        self.hotRows = self.rng.integers(0, self.shape[0], nHot)
+        self.hotColumns = self.rng.integers(0, self.shape[1], nHot)
+
+    def _noise(self, dtype, fullScale, gainFactor):
+        # Drawing the noise is the slow part, only redraw it when the camera changes
+        key = (np.dtype(dtype), fullScale, gainFactor)
+        if key != self.noiseKey:
+            rng = np.random.default_rng(self.seed + 1)
+            mean = self.options["background"] * fullScale
+            shape = self.shape
+            self.noisePool = np.empty((self.poolSize,) + shape, dtype)
+            for noise in self.noisePool:
+                np.copyto(
+                    noise,
+                    np.clip(rng.poisson(mean, shape) * gainFactor, 0, fullScale),
+                    casting="unsafe",
+                )
+            self.noiseKey = key
+        return self.noisePool
+
+    def draw(self, out, offsetX, offsetY, exposure, gain, fullScale):
+        """Draws the next frame of the scenario into out.
+
+        Args:
+            out: 2D array the ROI is drawn into, its dtype is the pixel type.
+            offsetX: Position of the ROI on the sensor [px].
+            offsetY: Position of the ROI on the sensor [px].
+            exposure: Exposure time [ms], the spot brightness is proportional to it.
+            gain: Gain [dB].
+            fullScale: Largest pixel value.
+        """
+        options = self.options
+        index = self.index
+        self.index += 1
+        gainFactor = 10 ** (gain / 20)
+        height, width = out.shape
+        offsetX = min(offsetX, self.shape[1] - width)
+        offsetY = min(offsetY, self.shape[0] - height)
+        # Draw the random numbers before anything is skipped, so every frame uses the
+        # same number of them
+        pool = self._noise(out.dtype, fullScale, gainFactor)
+        noise = pool[self.rng.integers(len(pool))]
+        jitter = self.rng.normal(0.0, options["jitter"], 2)
+        np.copyto(out, noise[offsetY : offsetY + height, offsetX : offsetX + width])
+
+        if index % options["lossPeriod"] >= options["beamLoss"]:
+            angle = 2 * np.pi * index / options["driftPeriod"]
+            x0 = options["center"][0] + options["drift"] * np.cos(angle) + jitter[0]
+            y0 = options["center"][1] + options["drift"] * np.sin(angle) + jitter[1]
+            x0 -= offsetX
+            y0 -= offsetY
+            peak = options["amplitude"] * fullScale * exposure * gainFactor
+            sigma = options["sigma"]
+            self._add_spot(out, x0, y0, sigma, peak, fullScale)
+            for dx, dy, relative in options["spots"]:
+                self._add_spot(out, x0 + dx, y0 + dy, sigma, relative * peak, fullScale)
+
+        if len(self.hotRows) > 0:
+            rows = self.hotRows - offsetY
+            columns = self.hotColumns - offsetX
+            inside = (rows >= 0) & (rows < height) & (columns >= 0) & (columns < width)
+            out[rows[inside], columns[inside]] = fullScale
+
+    def _add_spot(self, out, x0, y0, sigma, peak, fullScale):
+        if peak < 0.5:
+            return
+        # Distance at which the spot falls to half a count
+        r = sigma * np.sqrt(2 * np.log(2 * peak))
+        height, width = out.shape
+        x1 = max(int(x0 - r), 0)
+        x2 = min(int(np.ceil(x0 + r)) + 1, width)
+        y1 = max(int(y0 - r), 0)
+        y2 = min(int(np.ceil(y0 + r)) + 1, height)
+        if x1 >= x2 or y1 >= y2:
+            return
+        gx = np.exp(-((np.arange(x1, x2) - x0) ** 2) / (2 * sigma**2))
+        gy = np.exp(-((np.arange(y1, y2) - y0) ** 2) / (2 * sigma**2))
+        window = out[y1:y2, x1:x2]
+        spot = np.outer(peak * gy, gx)
+        spot += window
+        np.clip(spot, 0, fullScale, out=spot)
+        np.copyto(window, spot, casting="unsafe")
+
 
 class ImageGenerator(QObject):
     finished = pyqtSignal()
-    imageGrabbedSignal = pyqtSignal(dict)
 
     def __init__(self, camera):
         super().__init__()
         self.camera = camera
 
     def run(self):
+        # Without a frame rate frames are generated as fast as they can be
+        frameRate = self.camera._frameRate
+        self.period = 1 / frameRate if frameRate else None
+        self.frameId = 0
+        self.skipped = 0
+        self.start = time.perf_counter()
         self.timer = QTimer()
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
         self.timer.timeout.connect(self.create_image)
-        self.timer.start(100)
+        self.timer.start(0 if self.period is None else round(1000 * self.period))
+
+    def frame_metadata(self, offsetX, offsetY):
+        """Emulates the metadata of a camera running at a fixed frame rate.
+
+        The device clock starts with the stream and a frame is exposed every period, the
+        frames that were due while the generator was busy count as skipped. offsetX and
+        offsetY are the offsets the frame was drawn with.
+        """
+        cameraTime = time.perf_counter() - self.start
+        frameId = self.frameId + 1
+        if self.period is not None:
+            frameId = max(int(cameraTime / self.period), frameId)
+        self.skipped += frameId - self.frameId - 1
+        self.frameId = frameId
+        return {
+            "frame_id": frameId,
+            "camera_timestamp": cameraTime,
+            "host_time": time.time(),
+            "skipped": self.skipped,
+            "lost": 0,
+            "offsetX": offsetX,
+            "offsetY": offsetY,
+        }
 
     def create_image(self):
         try:
-            x0 = 600 - self.camera._offsetX + int(np.random.normal(0.0, 2.0))
-            y0 = 400 - self.camera._offsetY + int(np.random.normal(0.0, 2.0))
-            sigma = 50
-            img = np.random.randint(
-                0, 5, (self.camera._height, self.camera._width), dtype="int"
+            camera = self.camera
+            shape = (camera._height, camera._width)
+            dtype = camera._frame_dtype()
+            # Draw straight into a pooled frame, there is nothing to copy
+            image = camera.bufferPool.acquire(shape, dtype)
+            if image is None:
+                image = np.empty(shape, dtype)
+            # The worker can move the ROI while the frame is drawn
+            offsetX = camera._offsetX
+            offsetY = camera._offsetY
+            camera.synthesizer.draw(
+                image,
+                offsetX,
+                offsetY,
+                camera._exposure,
+                camera._gain,
+                camera._full_scale(),
             )
-            x = np.arange(self.camera._width)
-            y = np.arange(self.camera._height)
-            data = (
-                512
-                * np.exp(
-                    -((x[None, :] - x0) ** 2 + (y[:, None] - y0) ** 2) / (2 * sigma**2)
-                )
-                * self.camera._exposure
-            )
-            img += np.int_(data)
-            img *= np.int_(10 ** (self.camera._gain / 10))
-            data = {"image": img}
-            self.imageGrabbedSignal.emit(data)
+            # The image is "grabbed" once it has been generated
+            timestamps = []
+            timing.stamp(timestamps, "grab")
+            metadata = self.frame_metadata(offsetX, offsetY)
+            data = {"image": image, "timestamps": timestamps, "metadata": metadata}
+            # Only notify when the mailbox was empty, so notifications can't pile up
+            if camera.mailbox.put(data):
+                camera.frame_ready.emit()
         except:
             print("Error generating test image")
 
@@ -58,7 +249,7 @@ class TestCam(QObject):
     offsetY_changed = pyqtSignal(int)
     binning_horizontal_changed = pyqtSignal(int)
     binning_vertical_changed = pyqtSignal(int)
-    image_grabbed = pyqtSignal(dict)
+    frame_ready = pyqtSignal()
 
     stop = pyqtSignal()
 
@@ -74,28 +265,77 @@ class TestCam(QObject):
         self._triggerMode = "None"
         self._triggerSource = "None"
         self._pixelFormat = "Mono 8"
+        self._frameRate = config.testFrameRate
         self._binning_horizontal = 1
         self._binning_vertical = 1
+        self._binning_horizontal_mode = "Sum"
+        self._binning_vertical_mode = "Sum"
+        self.synthesizer = FrameSynthesizer(config.testScenario, config.testSeed)
+        self.thread = None
+        self.bufferPool = buffer_pool.BufferPool()
+        self.mailbox = mailbox.FrameMailbox(
+            lambda frame: self.bufferPool.release(frame["image"])
+        )
 
     def close(self):
-        pass
+        # Wait for the generator so no frames arrive after the camera is closed
+        self.stop_streaming()
 
     def start_streaming(self):
+        self.mailbox.clear()
+        self.bufferPool.configure((self._height, self._width), self._frame_dtype())
         self.thread = QThread()
         self.worker = ImageGenerator(self)
         self.worker.moveToThread(self.thread)
         self.thread.started.connect(self.worker.run)
         self.stop.connect(self.worker.stop)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.imageGrabbedSignal.connect(self.emit_image)
+        # quit is thread safe, calling it directly lets close() wait for the thread
+        self.worker.finished.connect(
+            self.thread.quit, Qt.ConnectionType.DirectConnection
+        )
 
         self.thread.start()
 
     def stop_streaming(self):
-        self.stop.emit()
+        # Wait for the generator, so a new stream can be started right away
+        if self.thread is not None:
+            # The generator stops its timer and quits the thread in its own thread
+            self.stop.emit()
+            self.thread.wait()
+            self.stop.disconnect(self.worker.stop)
+            self.thread = None
+
+    def _frame_dtype(self):
+        if self._pixelFormat.endswith("8"):
+            return "uint8"
+        return "uint16"
+
+    def _full_scale(self):
+        return 2 ** int(self._pixelFormat.split()[-1]) - 1
+
+    # Frame rate and scenario
+    # -----------------------------------------------------------------
+    def set_frame_rate(self, value):
+        """Sets the rate frames are generated at [Hz], takes effect on the next stream.
+
+        Args:
+            value: Target frame rate, None or 0 to generate frames as fast as possible.
+        """
+        self._frameRate = value
+
+    def get_frame_rate(self):
+        return self._frameRate
+
+    def set_scenario(self, scenario, seed=0):
+        """Selects the scenario from SCENARIOS the frames are drawn from.
+
+        The scenario plays from its first frame. It carries on across stream restarts,
+        such as the automatic ROI's, until the scenario or seed is set again.
+        """
+        self.synthesizer = FrameSynthesizer(scenario, seed)
 
-    def emit_image(self, data):
-        self.image_grabbed.emit(data)
+    def enumerate_scenario(self):
+        return list(SCENARIOS)
 
     # XXX Should not be used when using the grabbing thread
     # def get_image(self):
@@ -234,7 +474,7 @@ class TestCam(QObject):
         return self._pixelFormat
 
     def enumerate_pixel_format(self):
-        return ["Mono 8"]
+        return ["Mono 8", "Mono 12"]
 
     # Binning Horizontal
     # -----------------------------------------------------------------
@@ -259,3 +499,25 @@ class TestCam(QObject):
 
     def get_binning_vertical_range(self):
         return [0, 4]
+
+    # Binning Horizontal Mode
+    # -----------------------------------------------------------------
+    def set_binning_horizontal_mode(self, value):
+        self._binning_horizontal_mode = value
+
+    def get_binning_horizontal_mode(self):
+        return self._binning_horizontal_mode
+
+    def enumerate_binning_horizontal_mode(self):
+        return ["Sum", "Average"]
+
+    # Binning Vertical Mode
+    # -----------------------------------------------------------------
+    def set_binning_vertical_mode(self, value):
+        self._binning_vertical_mode = value
+
+    def get_binning_vertical_mode(self):
+        return self._binning_vertical_mode
+
+    def enumerate_binning_vertical_mode(self):
+        return ["Sum", "Average"]
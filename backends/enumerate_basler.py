@@ -1,4 +1,4 @@
-from pypylon import pylon
+from pypylon import genicam, pylon
 
 from interfaces import enumerate_interface
 
@@ -8,8 +8,24 @@ class EnumBasler(enumerate_interface.Enumerate):
         self.tlFactory = pylon.TlFactory.GetInstance()
         self.devices = []
 
-    def enumerate_devices(self):
-        self.devices = self.tlFactory.EnumerateDevices()
+    def enumerate_devices(self, progress=None):
+        """Finds the cameras one transport layer at a time.
+
+        USB cameras are found almost at once while GigE discovery can take seconds,
+        progress is called after each layer so the fast ones can be shown right away.
+        """
+        self.devices = []
+        for tlInfo in self.tlFactory.EnumerateTls():
+            try:
+                tl = self.tlFactory.CreateTl(tlInfo)
+            except genicam.GenericException:
+                continue
+            try:
+                self.devices += list(tl.EnumerateDevices())
+            finally:
+                self.tlFactory.ReleaseTl(tl)
+            if progress is not None:
+                progress()
 
     def get_serial_numbers(self):
         serial_numbers = []
@@ -0,0 +1,31 @@
+import glob
+import os
+
+import config
+from interfaces import enumerate_interface
+
+
+class EnumReplay(enumerate_interface.Enumerate):
+    """Lists the recordings in config.replayPath (a recording or a folder of them)."""
+
+    def __init__(self):
+        self.devices = []
+
+    def enumerate_devices(self, progress=None):
+        path = config.replayPath
+        if os.path.isdir(path):
+            self.devices = []
+            for pattern in ("*.npy", "*.h5", "*.hdf5"):
+                self.devices += sorted(glob.glob(os.path.join(path, pattern)))
+        else:
+            self.devices = [path]
+
+    def get_serial_numbers(self):
+        # The path of the recording takes the place of the serial number
+        return list(self.devices)
+
+    def get_names(self):
+        names = []
+        for device in self.devices:
+            names.append("Replay " + os.path.basename(device))
+        return names
@@ -7,14 +7,16 @@ from interfaces import enumerate_interface
 class EnumTest(enumerate_interface.Enumerate):
     def __init__(self):
         self.devices = []
+        # Fixed for the session, so the camera keeps its place in the list on a refresh
+        self.serial_number = int(np.random.randint(1000000, 9999999))
 
-    def enumerate_devices(self):
+    def enumerate_devices(self, progress=None):
         self.devices = ["Test Camera"]
 
     def get_serial_numbers(self):
         serial_numbers = []
         for device in self.devices:
-            serial_numbers.append(np.random.randint(1000000, 9999999))
+            serial_numbers.append(self.serial_number)
         return serial_numbers
 
     def get_names(self):
@@ -0,0 +1,75 @@
+import threading
+
+
+class FrameMailbox:
+    """Holds only the newest frame between the camera and the analysis thread.
+
+    The camera callback puts each frame in the mailbox, replacing (and dropping) any
+    frame the analysis hasn't taken yet. The camera only needs to notify the analysis
+    thread when the mailbox goes from empty to full, so at most one notification is
+    ever queued no matter how far the analysis falls behind.
+
+    Args:
+        release: Called with each frame that is dropped without being taken, so its
+            buffer can be reused.
+    """
+
+    def __init__(self, release=None):
+        self._release = release
+        self._lock = threading.Condition()
+        self._frame = None
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def put(self, frame) -> bool:
+        """Stores the frame, returns True if the mailbox was empty and needs a notification."""
+        with self._lock:
+            self.received += 1
+            dropped = self._frame
+            empty = dropped is None
+            if not empty:
+                self.dropped += 1
+            self._frame = frame
+        if dropped is not None and self._release is not None:
+            self._release(dropped)
+        return empty
+
+    def take(self):
+        """Returns the newest frame and empties the mailbox, None if it is empty."""
+        with self._lock:
+            frame = self._frame
+            self._frame = None
+            if frame is not None:
+                self.delivered += 1
+            self._lock.notify_all()
+        return frame
+
+    def wait_until_empty(self, timeout=None) -> bool:
+        """Blocks until the waiting frame is taken, returns False on timeout.
+
+        Lets a source that can produce frames on demand (like a replay) go exactly as
+        fast as the analysis without dropping frames.
+        """
+        with self._lock:
+            return self._lock.wait_for(lambda: self._frame is None, timeout)
+
+    def clear(self):
+        """Drops the waiting frame, if any, and resets the counters."""
+        with self._lock:
+            dropped = self._frame
+            self._frame = None
+            self.received = 0
+            self.delivered = 0
+            self.dropped = 0
+            self._lock.notify_all()
+        if dropped is not None and self._release is not None:
+            self._release(dropped)
+
+    def counters(self) -> dict:
+        with self._lock:
+            return {
+                "received": self.received,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+            }
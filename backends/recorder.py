@@ -0,0 +1,267 @@
+import ast
+import csv
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+import config
+from backends import buffer_pool
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+# Frame metadata written to the index, one row per frame
+INDEX_FIELDS = [
+    "frame_id",
+    "camera_timestamp",
+    "host_time",
+    "sx",
+    "sy",
+    "scalex",
+    "scaley",
+]
+INDEX_DTYPE = np.dtype(
+    [("frame_id", "int64")] + [(name, "float64") for name in INDEX_FIELDS[1:]]
+)
+
+# Room for the npy header, so the frame count can be filled in when the recording ends
+NPY_HEADER_SIZE = 128
+
+
+def index_path(path):
+    """Returns the path of the index written next to a .npy frame stack."""
+    return os.path.splitext(path)[0] + "_index.csv"
+
+
+def write_npy_header(f, shape, dtype):
+    """Writes a version 1.0 npy header padded to NPY_HEADER_SIZE bytes."""
+    header = repr(
+        {"descr": np.dtype(dtype).str, "fortran_order": False, "shape": tuple(shape)}
+    )
+    padding = NPY_HEADER_SIZE - 10 - len(header) - 1
+    if padding < 0:
+        raise ValueError("Frame shape doesn't fit in the npy header")
+    f.seek(0)
+    f.write(b"\x93NUMPY\x01\x00")
+    f.write(np.uint16(NPY_HEADER_SIZE - 10).tobytes())
+    f.write(header.encode("latin1") + b" " * padding + b"\n")
+
+
+def read_npy_header(path):
+    """Returns the shape and dtype stored in the header of a frame stack."""
+    with open(path, "rb") as f:
+        f.seek(10)
+        header = ast.literal_eval(f.read(NPY_HEADER_SIZE - 10).decode("latin1"))
+    return header["shape"], np.dtype(header["descr"])
+
+
+class NpyStackWriter:
+    """Appends frames to a .npy stack that can be opened with np.load(mmap_mode="r").
+
+    The files are opened right away and the header is written by start() once the
+    frame size is known, with a frame count of zero. It is rewritten with the real count
+    when the file is closed. The frame metadata goes to a csv index next to the stack.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.shape = None
+        self.dtype = None
+        self.count = 0
+        self.file = open(path, "wb")
+        try:
+            self.indexFile = open(index_path(path), "w", newline="")
+        except OSError:
+            self.file.close()
+            raise
+        self.index = csv.writer(self.indexFile)
+        self.index.writerow(INDEX_FIELDS)
+
+    def start(self, shape, dtype):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        write_npy_header(self.file, (0,) + self.shape, self.dtype)
+
+    def write(self, image, record):
+        # The buffer is contiguous, write it without making a bytes copy
+        self.file.write(image.data)
+        self.index.writerow([record[name] for name in INDEX_FIELDS])
+        self.count += 1
+
+    def close(self):
+        try:
+            if self.shape is None:
+                # Nothing was recorded, leave a valid empty stack
+                write_npy_header(self.file, (0,), "uint8")
+            else:
+                write_npy_header(self.file, (self.count,) + self.shape, self.dtype)
+        finally:
+            self.file.close()
+            self.indexFile.close()
+
+
+class Hdf5Writer:
+    """Appends frames to a chunked "frames" dataset and their metadata to "index".
+
+    The file is opened right away and the datasets are created by start() once the
+    frame size is known.
+    """
+
+    def __init__(self, path):
+        if h5py is None:
+            raise ImportError("Recording to HDF5 requires h5py")
+        self.file = h5py.File(path, "w")
+        self.frames = None
+        self.index = None
+        self.count = 0
+
+    def start(self, shape, dtype):
+        self.frames = self.file.create_dataset(
+            "frames",
+            shape=(0,) + tuple(shape),
+            maxshape=(None,) + tuple(shape),
+            chunks=(1,) + tuple(shape),
+            dtype=dtype,
+        )
+        self.index = self.file.create_dataset(
+            "index", shape=(0,), maxshape=(None,), chunks=(1024,), dtype=INDEX_DTYPE
+        )
+
+    def write(self, image, record):
+        self.frames.resize(self.count + 1, axis=0)
+        self.frames[self.count] = image
+        if self.count >= len(self.index):
+            self.index.resize(len(self.index) + 1024, axis=0)
+        self.index[self.count] = tuple(record[name] for name in INDEX_FIELDS)
+        self.count += 1
+
+    def close(self):
+        try:
+            if self.index is not None:
+                self.index.resize(self.count, axis=0)
+        finally:
+            self.file.close()
+
+
+class Recorder:
+    """Records frames to disk on its own thread so disk stalls don't hold up the analysis.
+
+    record() copies the frame into one of a fixed number of buffers and queues it for the
+    writer thread. When every buffer is waiting to be written the frame is dropped and
+    counted, so a slow disk only ever costs frames, never time in the caller. The number
+    of buffers is the memory budget divided by the size of the first frame, and they are
+    only allocated as the queue grows.
+
+    The file is opened here, so a path that can't be written to raises right away.
+    Errors while writing are kept in error (and status()["error"]), after which the
+    frames are no longer recorded.
+
+    Args:
+        path: File to record to, .h5 or .hdf5 records to HDF5, anything else to a .npy
+            stack with a csv index.
+        bufferSize: Memory for the frames waiting to be written [MB], None for
+            config.recordingBufferSize.
+    """
+
+    def __init__(self, path, bufferSize=None):
+        self.path = path
+        self.format = "hdf5" if path.endswith((".h5", ".hdf5")) else "npy"
+        writerClass = Hdf5Writer if self.format == "hdf5" else NpyStackWriter
+        self.writer = writerClass(path)
+        if bufferSize is None:
+            bufferSize = config.recordingBufferSize
+        self.bufferSize = bufferSize
+        self.bufferPool = None
+        self.queue = queue.Queue()
+        self.shape = None
+        self.dtype = None
+        self.written = 0
+        self.bytesWritten = 0
+        self.dropped = 0
+        self.mismatched = 0
+        self.error = None
+        self.startTime = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def record(self, image, metadata=None, transform=None):
+        """Queues a frame to be written, returns False if it was dropped.
+
+        Args:
+            image: 2D array representing image data, it is copied.
+            metadata: The frame's metadata from the camera.
+            transform: (sx, sy, scalex, scaley) of the frame.
+        """
+        if self.error is not None:
+            return False
+        if self.shape is None:
+            self.shape = image.shape
+            self.dtype = image.dtype
+            # Room for at least two frames, so one can be copied while one is written
+            nBuffers = max(int(self.bufferSize * 2**20 // image.nbytes), 2)
+            self.bufferPool = buffer_pool.BufferPool(nBuffers)
+        elif image.shape != self.shape or image.dtype != self.dtype:
+            # A stack can only hold frames of one size, restart to record a new ROI
+            self.mismatched += 1
+            return False
+        buffer = self.bufferPool.acquire(image.shape, image.dtype)
+        if buffer is None:
+            self.dropped += 1
+            return False
+        np.copyto(buffer, image)
+        record = dict.fromkeys(INDEX_FIELDS, np.nan)
+        record["frame_id"] = -1
+        if metadata is not None:
+            for name in ("frame_id", "camera_timestamp", "host_time"):
+                record[name] = metadata[name]
+        if transform is not None:
+            record["sx"], record["sy"], record["scalex"], record["scaley"] = transform
+        self.queue.put((buffer, record))
+        return True
+
+    def _run(self):
+        started = False
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            buffer, record = item
+            try:
+                if self.error is None:
+                    if not started:
+                        self.writer.start(buffer.shape, buffer.dtype)
+                        started = True
+                    self.writer.write(buffer, record)
+                    self.written += 1
+                    self.bytesWritten += buffer.nbytes
+            except Exception as error:
+                # Keep emptying the queue so the caller never waits on us
+                self.error = error
+            self.bufferPool.release(buffer)
+        try:
+            self.writer.close()
+        except Exception as error:
+            if self.error is None:
+                self.error = error
+
+    def stop(self):
+        """Writes the frames still in the queue and closes the file."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def status(self) -> dict:
+        """Returns the frames written and dropped and the sustained write rate [B/s]."""
+        elapsed = time.perf_counter() - self.startTime
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "mismatched": self.mismatched,
+            "queued": self.queue.qsize(),
+            "throughput": self.bytesWritten / elapsed if elapsed > 0 else 0.0,
+            "error": None if self.error is None else str(self.error),
+        }
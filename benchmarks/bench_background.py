@@ -0,0 +1,58 @@
+"""Checks that a stationary beam is found in every background mode after many frames.
+
+A running background must not learn the beam, or the beam is subtracted away and the
+centroid drifts into the noise. Each mode analyzes N frames of a fixed beam and reports
+the centroid error of the last frame. The run exits with status 1 if any is too large.
+
+Run from the repository root with:
+    python -m benchmarks.bench_background
+"""
+
+import sys
+
+import numpy as np
+
+from benchmarks.bench_centroid import make_frame
+from gui.worker import Worker
+
+# Largest centroid error of the last frame that counts as finding the beam [px]
+MAX_ERROR = 1.0
+
+
+def run(mode, shape, x0, y0, sigma, nFrames, rng):
+    """Returns the centroid error of the last of nFrames frames analyzed in mode."""
+    worker = Worker("benchmark", None)
+    worker.sx = 0
+    worker.sy = 0
+    worker.scalex = 1
+    worker.scaley = 1
+    worker.change_background_mode(mode)
+    results = []
+    worker.update.connect(results.append)
+    if mode == "dark":
+        # The dark frame is captured with the beam blocked
+        worker.capture_background(10)
+        for _ in range(10):
+            worker.process_image(make_frame(shape, x0, y0, sigma, 0.0, rng=rng))
+    for _ in range(nFrames):
+        worker.process_image(make_frame(shape, x0, y0, sigma, rng=rng))
+    centroid = results[-1]["centroid"]
+    return np.hypot(centroid[0] - x0, centroid[1] - y0)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    shape = (480, 640)
+    x0, y0, sigma = 300.0, 200.0, 20.0
+    N = 200
+    failed = False
+    for mode in ["off", "dark", "running"]:
+        error = run(mode, shape, x0, y0, sigma, N, rng)
+        status = "ok" if error <= MAX_ERROR else "FAILED"
+        failed |= error > MAX_ERROR
+        print(f"{mode:>8}: centroid error after {N} frames {error:.3f} px {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
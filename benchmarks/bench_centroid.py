@@ -0,0 +1,116 @@
+"""Compares the accuracy and speed of the beam center analysis modes.
+
+Run from the repository root with:
+    python -m benchmarks.bench_centroid
+"""
+
+import time
+
+import numpy as np
+
+import analysis.fitting as fitting
+import analysis.image as an
+
+
+def make_frame(
+    shape, x0, y0, sigma, amplitude=200.0, noise=2.0, rng=None, dtype="uint16"
+):
+    """Returns a frame with a Gaussian spot and Poisson background noise."""
+    if rng is None:
+        rng = np.random.default_rng()
+    Y, X = shape
+    x = np.arange(X) + 0.5
+    y = np.arange(Y) + 0.5
+    gx = np.exp(-((x - x0) ** 2) / (2 * sigma**2))
+    gy = np.exp(-((y - y0) ** 2) / (2 * sigma**2))
+    img = amplitude * np.outer(gy, gx) + rng.poisson(noise, shape)
+    return np.rint(np.clip(img, 0, np.iinfo(dtype).max)).astype(dtype)
+
+
+MODES = {
+    "gaussian": {"analysis": "gaussian"},
+    "jacobian": {"analysis": "gaussian", "jacobian": True},
+    "lm": {"analysis": "gaussian", "jacobian": True, "fitMethod": "lm"},
+    "batch": {"analysis": "gaussian", "fitMethod": "batch"},
+    "fast fit": {"analysis": "gaussian", "fastFit": True},
+    "moments": {"analysis": "moments"},
+}
+
+
+def run(config, frames, truth):
+    previousPx = None
+    previousPy = None
+    errors = []
+    widths = []
+    start = time.perf_counter()
+    for img, (x0, y0, sigma) in zip(frames, truth):
+        x, y = an.get_xy_arrays(img)
+        centroid, px, py, x_proj, y_proj = an.findImageCenter(
+            img, x, y, config, previousPx, previousPy
+        )
+        previousPx = px
+        previousPy = py
+        errors.append(np.hypot(centroid[0] - x0, centroid[1] - y0))
+        widths.append(0.5 * (px[2] + py[2]) - sigma)
+    elapsed = time.perf_counter() - start
+    return elapsed / len(frames), np.array(errors), np.array(widths)
+
+
+def run_fits(config, frames):
+    """Returns the average time to fit the x and y projections of a frame."""
+    jacobian = config.get("jacobian", False)
+    method = config.get("fitMethod", "trf")
+    projections = []
+    for img in frames:
+        x, y = an.get_xy_arrays(img)
+        x_proj = img.sum(axis=0, dtype="float")
+        y_proj = img.sum(axis=1, dtype="float")
+        p0x = [np.max(x_proj), x[np.argmax(x_proj)], 10.0, 0.0]
+        p0y = [np.max(y_proj), y[np.argmax(y_proj)], 10.0, 0.0]
+        projections.append((x, y, x_proj, y_proj, p0x, p0y))
+    start = time.perf_counter()
+    if method == "stack":
+        # Fit the projections of every frame in a single batched call
+        x, y = projections[0][:2]
+        x_proj, y_proj, p0x, p0y = (np.array(a) for a in list(zip(*projections))[2:])
+        fitting.fit_projections(x_proj, y_proj, x, y, p0x, p0y)
+    elif method == "batch":
+        for x, y, x_proj, y_proj, p0x, p0y in projections:
+            fitting.fit_projections(x_proj, y_proj, x, y, p0x, p0y)
+    else:
+        for x, y, x_proj, y_proj, p0x, p0y in projections:
+            an._fit_projection(x, x_proj, p0x, jacobian, method)
+            an._fit_projection(y, y_proj, p0y, jacobian, method)
+    return (time.perf_counter() - start) / len(frames)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    N = 20
+    for shape in [(480, 640), (1024, 1280), (2048, 2448)]:
+        frames = []
+        truth = []
+        for _ in range(N):
+            x0 = rng.uniform(0.3, 0.7) * shape[1]
+            y0 = rng.uniform(0.3, 0.7) * shape[0]
+            sigma = rng.uniform(20.0, 60.0)
+            frames.append(make_frame(shape, x0, y0, sigma, rng=rng))
+            truth.append((x0, y0, sigma))
+        print(f"Frame size {shape[1]}x{shape[0]}")
+        for mode, config in MODES.items():
+            t, err, dw = run(config, frames, truth)
+            print(
+                f"  {mode:>10}: {t * 1e3:8.2f} ms/frame ({1 / t:7.1f} fps), "
+                f"centroid error {np.mean(err):.3f} px (max {np.max(err):.3f}), "
+                f"sigma error {np.mean(dw):+.3f} px"
+            )
+        print("  Projection fit time per frame")
+        for mode in ["gaussian", "jacobian", "lm", "batch"]:
+            t = run_fits(MODES[mode], frames)
+            print(f"  {mode:>10}: {t * 1e3:8.2f} ms/frame")
+        t = run_fits({"fitMethod": "stack"}, frames)
+        print(f"  {'stack':>10}: {t * 1e3:8.2f} ms/frame")
+
+
+if __name__ == "__main__":
+    main()
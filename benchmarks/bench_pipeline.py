@@ -0,0 +1,312 @@
+"""Measures the throughput, stage latencies and peak memory of the worker's pipeline.
+
+Frames drawn by the test camera's FrameSynthesizer are run through
+Worker.process_image for combinations of frame size, dtype, spot size, noise level and
+median filter. By default only a few mid-size cases are run, --full runs every
+combination (which takes hours with the median filter at 20 MP). Each case is repeated
+and the best repeat is kept, so other work on the machine doesn't show up as a
+regression. The results are saved to a JSON file, and a later run can be compared
+against it to catch regressions.
+
+Run from the repository root with:
+    python -m benchmarks.bench_pipeline --output baseline.json
+    python -m benchmarks.bench_pipeline --baseline baseline.json
+
+A run that is slower than the baseline by more than the tolerance exits with status 1.
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+
+import analysis.timing as timing
+from backends.camera_test import FrameSynthesizer
+from gui.worker import Worker
+
+SIZES = {
+    "0.3MP": (480, 640),
+    "1.3MP": (1024, 1280),
+    "5MP": (2048, 2448),
+    "20MP": (3648, 5472),
+}
+# Pixel format the saturation level is taken from, and its largest value
+DTYPES = {
+    "uint8": ("Mono8", 255),
+    "uint16": ("Mono12", 4095),
+}
+# Sigma of the spot [px]
+SPOTS = {"small": 10.0, "large": 60.0}
+# Mean of the Poisson background [counts]
+NOISE = {"low": 2.0, "high": 20.0}
+MEDIAN = {"off": False, "on": True}
+# Cases run without --full
+DEFAULT_CASES = {
+    "sizes": ["1.3MP"],
+    "dtypes": ["uint16"],
+    "spots": list(SPOTS),
+    "noise": ["low"],
+    "median": ["off"],
+}
+
+# Stage latency changes smaller than this are timer noise, not regressions [s]
+MIN_LATENCY_CHANGE = 1e-4
+
+
+def case_name(size, dtype, spot, noise, median):
+    return f"{size} {dtype} spot={spot} noise={noise} median={median}"
+
+
+def make_frames(shape, dtype, sigma, noise, nFrames, seed=0):
+    """Returns nFrames frames of the test camera's drift scenario.
+
+    The frame is the whole sensor, and the spot drifts around a circle through the
+    middle of the frame, so it is at a different position in each frame.
+    """
+    fullScale = DTYPES[dtype][1]
+    synthesizer = FrameSynthesizer("drift", seed, poolSize=nFrames, shape=shape)
+    synthesizer.options.update(
+        {
+            "center": (0.5 * shape[1], 0.5 * shape[0]),
+            "drift": 0.2 * min(shape),
+            "driftPeriod": nFrames,
+            "sigma": sigma,
+            "background": noise / fullScale,
+        }
+    )
+    frames = []
+    for _ in range(nFrames):
+        frame = np.empty(shape, dtype)
+        synthesizer.draw(frame, 0, 0, 1.0, 0.0, fullScale)
+        frames.append(frame)
+    return frames
+
+
+def make_worker(analysis):
+    """Returns a worker set up to analyze frames without a camera."""
+    worker = Worker("benchmark", None)
+    worker.sx = 0
+    worker.sy = 0
+    worker.scalex = 1
+    worker.scaley = 1
+    worker.config["analysis"] = analysis
+    return worker
+
+
+def best_summary(summaries):
+    """Returns the stage summaries with the smallest of each statistic over the repeats."""
+    best = {}
+    for stage in summaries[0]:
+        repeats = [summary[stage] for summary in summaries if stage in summary]
+        best[stage] = {
+            key: min(repeat[key] for repeat in repeats if key in repeat)
+            for key in repeats[0]
+        }
+        best[stage]["count"] = sum(repeat["count"] for repeat in repeats)
+    return best
+
+
+def run_case(worker, frames, nFrames, nRepeats, minTime, nWarmup=2):
+    """Returns the throughput, stage latencies and peak memory of one case.
+
+    The frames are cycled through until nFrames have been analyzed and minTime [s] has
+    passed, which is repeated nRepeats times. Anything else running on the machine can
+    only slow a repeat down, so the best throughput and the smallest of each latency
+    statistic over the repeats are kept. The peak memory is measured on a separate
+    frame, tracemalloc slows down the analysis.
+    """
+    received = []
+    worker.update.connect(received.append)
+    worker.previousPx = None
+    worker.previousPy = None
+    # The first frames fill the geometry cache and give the fits a starting point
+    for i in range(nWarmup):
+        worker.process_image(frames[i % len(frames)])
+
+    fps = []
+    summaries = []
+    for _ in range(nRepeats):
+        received.clear()
+        i = 0
+        start = time.perf_counter()
+        while i < nFrames or time.perf_counter() - start < minTime:
+            timestamps = []
+            timing.stamp(timestamps, "start")
+            worker.process_image(frames[i % len(frames)], timestamps)
+            i += 1
+        elapsed = time.perf_counter() - start
+
+        stats = timing.TimingStats(len(received))
+        for data in received:
+            timestamps = data["timestamps"]
+            stats.add_timestamps(timestamps)
+            stats.add("total", timestamps[-1][1] - timestamps[0][1])
+        fps.append(len(received) / elapsed)
+        summaries.append(stats.summary())
+
+    tracemalloc.start()
+    worker.process_image(frames[0])
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    worker.update.disconnect(received.append)
+
+    stages = best_summary(summaries)
+    return {
+        "frames": stages["total"]["count"],
+        "fps": max(fps),
+        "stages": stages,
+        "peakMemory": peakMemory,
+        "frameBytes": frames[0].nbytes,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Returns a description of every measurement that is worse than the baseline.
+
+    Args:
+        results: Cases of this run.
+        baseline: Cases of the baseline run, cases that weren't run are skipped.
+        tolerance: Fraction a measurement can get worse by before it is reported.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        if result["fps"] < old["fps"] * (1 - tolerance):
+            regressions.append(f"{name}: {old['fps']:.1f} -> {result['fps']:.1f} fps")
+        for stage, summary in result["stages"].items():
+            if stage not in old["stages"] or "p50" not in summary:
+                continue
+            before = old["stages"][stage]["p50"]
+            after = summary["p50"]
+            if after > before * (1 + tolerance) and after - before > MIN_LATENCY_CHANGE:
+                regressions.append(
+                    f"{name}: {stage} p50 {before * 1e3:.2f} -> {after * 1e3:.2f} ms"
+                )
+        if result["peakMemory"] > old["peakMemory"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: peak memory {old['peakMemory'] / 2**20:.1f} -> "
+                f"{result['peakMemory'] / 2**20:.1f} MiB"
+            )
+    return regressions
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "system": platform.system(),
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--output", help="JSON file to save the results to.")
+    parser.add_argument("--baseline", help="JSON file of a run to compare against.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Fraction a measurement can get worse by before it is a regression.",
+    )
+    parser.add_argument(
+        "--frames", type=int, default=50, help="Fewest frames analyzed per repeat."
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.5,
+        help="Shortest time each repeat runs for [s].",
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=3, help="Repeats of each case, the best is kept."
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Run every combination of the cases not selected below.",
+    )
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES))
+    parser.add_argument("--dtypes", nargs="+", choices=list(DTYPES))
+    parser.add_argument("--spots", nargs="+", choices=list(SPOTS))
+    parser.add_argument("--noise", nargs="+", choices=list(NOISE))
+    parser.add_argument("--median", nargs="+", choices=list(MEDIAN))
+    parser.add_argument(
+        "--analysis", choices=["gaussian", "moments"], default="gaussian"
+    )
+    args = parser.parse_args(argv)
+    options = {
+        "sizes": SIZES,
+        "dtypes": DTYPES,
+        "spots": SPOTS,
+        "noise": NOISE,
+        "median": MEDIAN,
+    }
+    for name, choices in options.items():
+        if getattr(args, name) is None:
+            default = list(choices) if args.full else DEFAULT_CASES[name]
+            setattr(args, name, default)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    worker = make_worker(args.analysis)
+    results = {}
+    for size, dtype in itertools.product(args.sizes, args.dtypes):
+        worker.update_saturation(DTYPES[dtype][0])
+        for spot, noise in itertools.product(args.spots, args.noise):
+            frames = make_frames(SIZES[size], dtype, SPOTS[spot], NOISE[noise], 4)
+            for median in args.median:
+                worker.config["medianFilter"] = MEDIAN[median]
+                name = case_name(size, dtype, spot, noise, median)
+                result = run_case(
+                    worker, frames, args.frames, args.repeats, args.min_time
+                )
+                results[name] = result
+                total = result["stages"]["total"]
+                print(
+                    f"{name:>48}: {result['fps']:7.1f} fps, "
+                    f"latency p50 {total['p50'] * 1e3:8.2f} ms "
+                    f"p99 {total['p99'] * 1e3:8.2f} ms, "
+                    f"peak memory {result['peakMemory'] / 2**20:7.1f} MiB"
+                )
+
+    output = {
+        "environment": environment(),
+        "analysis": args.analysis,
+        "frames": args.frames,
+        "repeats": args.repeats,
+        "cases": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["environment"] != output["environment"]:
+            print("Warning: the baseline was measured in a different environment")
+        regressions = compare(results, baseline["cases"], args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Compares the cost of the full frame and pyramid analysis across frame sizes.
+
+The spot size is fixed, so the pyramid modes should cost nearly the same at every
+frame size while the full frame analysis grows with the number of pixels.
+
+Run from the repository root with:
+    python -m benchmarks.bench_pyramid
+"""
+
+import time
+
+import numpy as np
+
+import analysis.image as an
+from benchmarks.bench_centroid import make_frame
+
+MODES = {
+    "full frame": {"fitMethod": "lm", "jacobian": True},
+    "pyramid sum": {"fitMethod": "lm", "jacobian": True, "pyramid": True},
+    "pyramid decimate": {
+        "fitMethod": "lm",
+        "jacobian": True,
+        "pyramid": True,
+        "pyramidMethod": "decimate",
+    },
+}
+
+
+def main():
+    rng = np.random.default_rng(0)
+    N = 10
+    sigma = 20.0
+    for shape in [(480, 640), (1024, 1280), (2048, 2448), (3648, 5472)]:
+        frames = []
+        truth = []
+        for _ in range(N):
+            x0 = rng.uniform(0.2, 0.8) * shape[1]
+            y0 = rng.uniform(0.2, 0.8) * shape[0]
+            frames.append(make_frame(shape, x0, y0, sigma, rng=rng))
+            truth.append((x0, y0))
+        x, y = an.get_xy_arrays(frames[0])
+        print(f"Frame size {shape[1]}x{shape[0]} ({shape[0] * shape[1] / 1e6:.1f} MP)")
+        for mode, config in MODES.items():
+            errors = []
+            start = time.perf_counter()
+            for img, (x0, y0) in zip(frames, truth):
+                # No previous fit, every frame has to find the beam from scratch
+                centroid, px, py, x_proj, y_proj = an.findImageCenter(
+                    img, x, y, config, None, None
+                )
+                errors.append(np.hypot(centroid[0] - x0, centroid[1] - y0))
+            t = (time.perf_counter() - start) / N
+            print(
+                f"  {mode:>16}: {t * 1e3:8.2f} ms/frame, "
+                f"centroid error {np.mean(errors):.3f} px (max {np.max(errors):.3f})"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,43 @@ import sys
 alignViewPath = None
 iconPath = None
 savePath = None
+calibrationPath = None
+# Devices found by the last search, shown while the next one runs
+deviceCachePath = None
+# Time between searches for cameras while none is connected [s], None to only search
+# when asked
+deviceRefreshInterval = 10.0
 testing = False
+# Recording (or folder of recordings) to replay instead of using a camera
+replayPath = None
 darkMode = False
+# Frame rate [Hz] (None for as fast as possible), scenario and seed of the test camera
+testFrameRate = 10.0
+testScenario = "jitter"
+testSeed = 0
+# Largest rate the image display is redrawn at [Hz], None for the monitor refresh rate
+displayRate = 30.0
+# Largest rate a camera parameter is written at while its control is dragged [Hz]
+parameterWriteRate = 20.0
+# Memory for frames waiting to be written while recording [MB], frames are dropped
+# when it is full
+recordingBufferSize = 512.0
 
 
 def defPaths():
     global alignViewPath
     global iconPath
     global savePath
+    global calibrationPath
+    global deviceCachePath
 
     alignViewPath = getAlignViewPath()
     iconPath = os.path.join(alignViewPath, "designer")
+    # Per camera calibrations have to survive updates of a frozen bundle
+    calibrationPath = os.path.join(os.path.expanduser("~"), ".alignView", "calibration")
+    deviceCachePath = os.path.join(
+        os.path.expanduser("~"), ".alignView", "devices.json"
+    )
 
 
 def getAlignViewPath():
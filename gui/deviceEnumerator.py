@@ -0,0 +1,67 @@
+import json
+import os
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+
+def load_device_cache(path, backend):
+    """Returns the (name, serial number) of the devices found the last time, if any.
+
+    Args:
+        path: Cache file, None to not use a cache.
+        backend: Name of the enumerator class, devices of other backends are ignored.
+    """
+    if path is None:
+        return []
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return []
+    if cache.get("backend") != backend:
+        return []
+    return [tuple(device) for device in cache.get("devices", [])]
+
+
+def save_device_cache(path, backend, devices):
+    if path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"backend": backend, "devices": devices}, f, indent=2)
+    except OSError as error:
+        print(f"Error saving the device list: {error}")
+
+
+class DeviceEnumerator(QObject):
+    """Searches for cameras on its own thread, so a slow search can't block the gui.
+
+    devicesFound is emitted with the (name, serial number) of the devices found so far
+    each time the backend reports progress, and finished with every device found once
+    the search is complete.
+    """
+
+    devicesFound = pyqtSignal(list)
+    finished = pyqtSignal(list)
+
+    def __init__(self, enumerate_devices):
+        super().__init__()
+        self.enumerate_devices = enumerate_devices
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            self.enumerate_devices.enumerate_devices(
+                lambda: self.devicesFound.emit(self._devices())
+            )
+            devices = self._devices()
+        except Exception as error:
+            print(f"Error enumerating devices: {error}")
+            devices = []
+        self.finished.emit(devices)
+
+    def _devices(self):
+        names = self.enumerate_devices.get_names()
+        serial_numbers = self.enumerate_devices.get_serial_numbers()
+        return list(zip(names, serial_numbers))
@@ -1,10 +1,10 @@
 import numpy as np
 import pyqtgraph as pg
-import scipy.optimize as opt
 from PyQt6 import QtCore, QtGui
 from PyQt6.QtCore import QThread, pyqtSignal, pyqtSlot
 from PyQt6.QtWidgets import QFileDialog, QMainWindow, QMessageBox
 
+import analysis.fitting as fitting
 import analysis.image as an
 import config
 import gui.ui.ui_LineoutWindow as ui_LineoutWindow
@@ -63,56 +63,60 @@ class AlignViewLineoutWindow(QMainWindow, ui_LineoutWindow.Ui_LineoutView):
 
     @pyqtSlot(dict)
     def on_new_image(self, data):
-        self.update_xplot(data)
-        self.update_yplot(data)
+        xcoord, xlineout, ycoord, ylineout = self.get_lineouts(data)
+        px, py = self.fit_gaussian(
+            xcoord, xlineout, data["centroid"][0], ycoord, ylineout, data["centroid"][1]
+        )
+        self.update_xplot(xcoord, xlineout, px)
+        self.update_yplot(ycoord, ylineout, py)
         self.update_plot(data)
 
-    def update_xplot(self, data):
+    def get_lineouts(self, data):
+        """Returns the lineouts of the image through the beam centroid."""
+        xindex = int((data["centroid"][1] - data["sy"]) / data["scaley"])
+        yindex = int((data["centroid"][0] - data["sx"]) / data["scalex"])
+        xlineout = data["image"][xindex, :]
+        ylineout = data["image"][:, yindex]
+        return data["x"], xlineout, data["y"], ylineout
+
+    def update_xplot(self, coord, lineout, px):
         # Plot the raw data
-        index = int((data["centroid"][1] - data["sy"]) / data["scaley"])
-        coord = data["x"]
-        lineout = data["image"][index, :]
         self.xPlotItem.setData(coord, lineout)
-        # Fit the curve
-        px = self.fit_gaussian(coord, lineout, data["centroid"][0])
+        if px is None:
+            self.xFitItem.clear()
+            return
         self.xFitItem.setData(coord, an.gaussian(coord, *px))
         value = self.scale_number_units(px[2] * self.pixelCalField.value() * 1e-6, "m")
         self.sigmaXLabel.setText("Sigma X: " + value)
 
-    def update_yplot(self, data):
+    def update_yplot(self, coord, lineout, py):
         # Plot the raw data
-        index = int((data["centroid"][0] - data["sx"]) / data["scalex"])
-        coord = data["y"]
-        lineout = data["image"][:, index]
         self.yPlotItem.setData(lineout, coord)
-        # Fit the curve
-        py = self.fit_gaussian(coord, lineout, data["centroid"][1])
+        if py is None:
+            self.yFitItem.clear()
+            return
         self.yFitItem.setData(an.gaussian(coord, *py), coord)
         value = self.scale_number_units(py[2] * self.pixelCalField.value() * 1e-6, "m")
         self.sigmaYLabel.setText("Sigma Y: " + value)
 
     def update_plot(self, data):
         img = data["image"]
-        self.imageItem.setImage(img, autoLevels=True)
+        # Use the levels from the frame statistics rather than scanning the image
+        frameStats = data["stats"]
+        levels = (frameStats["min"], max(frameStats["max"], frameStats["min"] + 1))
+        self.imageItem.setImage(img, autoLevels=False, levels=levels)
         tr = QtGui.QTransform()
         tr.translate(data["sx"] * data["scalex"], data["sy"] * data["scaley"])
         tr.scale(data["scalex"], data["scaley"])
         self.imageItem.setTransform(tr)
 
-    def fit_gaussian(self, x, y, x0):
-        # A, x0, C, offset
-        A0 = np.max(y)
-        C0 = 0.001
-        y0 = y[0]
-        bounds = ([0.0, x[0], 0.0, 0.0], [np.inf, x[-1], np.inf, np.inf])
-        try:
-            p, covariancex = opt.curve_fit(
-                an._gaussian, x, y, p0=(A0, x0, C0, y0), bounds=bounds
-            )
-            p[2] = 1 / np.sqrt(2 * p[2])
-        except RuntimeError:
-            p = None
-        return p
+    def fit_gaussian(self, x, xlineout, x0, y, ylineout, y0):
+        """Fits both lineouts together, returns None in place of a failed fit."""
+        # A, x0, sigma, offset, the sigma matches a guess of C = 0.001
+        p0x = (np.max(xlineout), x0, 22.4, xlineout[0])
+        p0y = (np.max(ylineout), y0, 22.4, ylineout[0])
+        px, py = fitting.fit_projections(xlineout, ylineout, x, y, p0x, p0y)
+        return px[0], py[0]
 
     def scale_number_units(self, value, unit, precision=4):
         prefixs = np.array(["T", "G", "M", "k", "", "m", "μ", "n", "p", "f"])
@@ -1,19 +1,46 @@
 import os
 import time
+from collections import deque
 
 import numpy as np
 import pyqtgraph as pg
-from PyQt6 import QtGui
-from PyQt6.QtCore import QThread, pyqtSignal, pyqtSlot
-from PyQt6.QtWidgets import QFileDialog, QMainWindow, QMessageBox
+from PyQt6 import QtCore, QtGui
+from PyQt6.QtCore import QThread, QTimer, pyqtSignal, pyqtSlot
+from PyQt6.QtWidgets import QFileDialog, QInputDialog, QMainWindow, QMessageBox
 
+import analysis.timing as timing
 import config
 import gui.ui.ui_MainWindow as ui_MainWindow
-from backends import camera_basler, camera_test, enumerate_basler, enumerate_test
-from gui import lineoutWindow
+from backends import (
+    camera_basler,
+    camera_replay,
+    camera_test,
+    enumerate_basler,
+    enumerate_replay,
+    enumerate_test,
+)
+from gui import deviceEnumerator, lineoutWindow, timingWindow
 from gui.worker import Worker
 
 
+class RateMeter:
+    """Rolling average of how often tick() is called."""
+
+    def __init__(self, N=20):
+        self.times = deque(maxlen=N)
+
+    def tick(self):
+        self.times.append(time.perf_counter())
+
+    def reset(self):
+        self.times.clear()
+
+    def rate(self) -> float:
+        if len(self.times) < 2 or self.times[-1] == self.times[0]:
+            return 0.0
+        return (len(self.times) - 1) / (self.times[-1] - self.times[0])
+
+
 class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
     """Class that handles the main window and the gui functionality.
 
@@ -25,18 +52,26 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
     signal_stop_streaming = pyqtSignal()
     request_parameters = pyqtSignal()
     request_offset_range = pyqtSignal()
+    signal_start_recording = pyqtSignal(str)
+    signal_stop_recording = pyqtSignal()
+    signal_calibrate_defects = pyqtSignal(int)
+    request_enumeration = pyqtSignal()
     update = pyqtSignal(dict)
 
     def __init__(self, parent=None, icon=None):
         super().__init__(parent)
         self.serial_number = None
+        # The worker whose updates are displayed, None while disconnected
+        self.activeWorker = None
         self.streamig = False
         self.first_image = True
-        self.lastTime = time.time()
-
-        self.N_elapsed = 20
-        self.elapsed = np.zeros(self.N_elapsed)
-        self.i_elapsed = 0
+        self.analysisRate = RateMeter()
+        self.displayRate = RateMeter()
+        self.latestData = None
+        self.displayedData = None
+        self.timing = timing.TimingStats()
+        self.clockOffset = timing.ClockOffset()
+        self.timingDock = None
 
         self.max_level = 4096
         self.centroid = np.zeros(2)
@@ -48,12 +83,16 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
         self.setup_plot()
         self.add_crosshairs()
         self.add_circles()
-        self.refresh_camera_list()
+        self.setup_display_timer()
+        self.setup_device_enumeration()
 
     def select_backend(self):
         if config.testing:
             self.enumerate_devices = enumerate_test.EnumTest()
             self.camera_class = camera_test.TestCam
+        elif config.replayPath is not None:
+            self.enumerate_devices = enumerate_replay.EnumReplay()
+            self.camera_class = camera_replay.Replay
         else:
             self.enumerate_devices = enumerate_basler.EnumBasler()
             self.camera_class = camera_basler.Basler
@@ -81,6 +120,10 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
         self.targetCircleSizeField.valueChanged.connect(self.set_target_circle_size)
         self.beamCircleSizeField.valueChanged.connect(self.set_centroid_circle_size)
         self.displayLineoutsButton.clicked.connect(self.show_lineout_window)
+        self.displayTimingButton.clicked.connect(self.show_timing_panel)
+        self.startRecordingButton.clicked.connect(self.start_recording)
+        self.stopRecordingButton.clicked.connect(self.stop_recording)
+        self.calibrateDefectsButton.clicked.connect(self.calibrate_defects)
 
     def set_icons(self):
         icon = QtGui.QIcon()
@@ -101,10 +144,25 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
         hist.vb.enableAutoRange("y", False)
         self.set_hist_range(self.max_level)
         hist.sigLevelsChanged.connect(self.on_levels_changed)
+        # The worker sends the histogram with each frame, don't scan the image again
+        self.imageView.getImageItem().sigImageChanged.disconnect(hist.imageChanged)
         cmap = pg.colormap.get("magma")
         hist.gradient.setColorMap(cmap)
         hist.gradient.showTicks(False)
 
+    def setup_display_timer(self):
+        # The display is redrawn at most displayRate times a second with the latest
+        # analyzed frame, independent of how fast the frames are analyzed
+        self.displayTimer = QTimer(self)
+        self.displayTimer.timeout.connect(self.render)
+        self.set_display_rate(config.displayRate)
+
+    def set_display_rate(self, rate):
+        """Sets the largest rate the display is redrawn at [Hz], None for the monitor rate."""
+        if rate is None:
+            rate = self.screen().refreshRate()
+        self.displayTimer.setInterval(int(round(1000.0 / rate)))
+
     def set_hist_range(self, max):
         self.max_level = max
         hist = self.imageView.getHistogramWidget()
@@ -164,20 +222,85 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
         self.centroid_circle.removeHandle(0)
         self.centroid_circle.setVisible(False)
 
-    # Methods for connecting and disconnecting the camera
+    # Methods for finding cameras
     # -----------------------------------------------------------------
+    def setup_device_enumeration(self):
+        """Searches for cameras on its own thread, starting from the last list found.
+
+        The search runs at startup, when the refresh button is pressed and every
+        config.deviceRefreshInterval while no camera is connected, to pick up cameras
+        that are plugged in.
+        """
+        self.enumerating = False
+        self.deviceBackend = type(self.enumerate_devices).__name__
+        self.devices = deviceEnumerator.load_device_cache(
+            config.deviceCachePath, self.deviceBackend
+        )
+        self.show_devices(self.devices)
+
+        self.enumerationThread = QThread()
+        self.enumerator = deviceEnumerator.DeviceEnumerator(self.enumerate_devices)
+        self.enumerator.moveToThread(self.enumerationThread)
+        self.request_enumeration.connect(self.enumerator.run)
+        self.enumerator.devicesFound.connect(self.on_devices_found)
+        self.enumerator.finished.connect(self.on_enumeration_finished)
+        self.enumerationThread.start()
+
+        self.enumerationTimer = QTimer()
+        self.enumerationTimer.timeout.connect(self.on_enumeration_timer)
+        if config.deviceRefreshInterval is not None:
+            self.enumerationTimer.start(round(1000 * config.deviceRefreshInterval))
+        self.refresh_camera_list()
+
     def refresh_camera_list(self):
+        """Starts a search for cameras, the list is updated as they are found."""
+        if self.enumerating:
+            return
+        self.enumerating = True
+        self.refreshButton.setEnabled(False)
+        self.request_enumeration.emit()
+
+    def on_enumeration_timer(self):
+        if self.serial_number is None:
+            self.refresh_camera_list()
+
+    @pyqtSlot(list)
+    def on_devices_found(self, devices):
+        # Keep showing the cameras from the last search until the search is complete
+        self.show_devices(devices + [d for d in self.devices if d not in devices])
+
+    @pyqtSlot(list)
+    def on_enumeration_finished(self, devices):
+        self.enumerating = False
+        self.refreshButton.setEnabled(True)
+        self.show_devices(devices)
+        if devices != self.devices:
+            self.devices = devices
+            deviceEnumerator.save_device_cache(
+                config.deviceCachePath, self.deviceBackend, devices
+            )
+
+    def show_devices(self, devices):
+        """Fills the camera list, keeping the selected camera selected."""
+        selected = self.cameraSelectField.currentData()
         self.cameraSelectField.clear()
-        self.enumerate_devices.enumerate_devices()
-        serial_numbers = self.enumerate_devices.get_serial_numbers()
-        names = self.enumerate_devices.get_names()
-        N = len(serial_numbers)
-        if N > 0 and (self.serial_number is None):
+        for name, serial_number in devices:
+            self.cameraSelectField.addItem(f"{name} ({serial_number})", serial_number)
+        index = self.cameraSelectField.findData(selected)
+        if index >= 0:
+            self.cameraSelectField.setCurrentIndex(index)
+        if len(devices) > 0 and (self.serial_number is None):
             self.connectButton.setEnabled(True)
-        for i in range(N):
-            self.cameraSelectField.addItem(
-                f"{names[i]} ({serial_numbers[i]})", serial_numbers[i]
-            )
+
+    def closeEvent(self, event):
+        # A thread can't be destroyed while it runs, let a search finish first
+        self.enumerationTimer.stop()
+        self.enumerationThread.quit()
+        self.enumerationThread.wait()
+        super().closeEvent(event)
+
+    # Methods for connecting and disconnecting the camera
+    # -----------------------------------------------------------------
 
     def connect_camera(self):
         self.disconnect_camera()
@@ -191,6 +314,7 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
         self.thread = QThread()
         self.worker = Worker(self.serial_number, self.camera_class)
         self.worker.moveToThread(self.thread)
+        self.activeWorker = self.worker
 
         # Connect signals and slots to control thread startup and shutdown
         self.worker.finished.connect(self.thread.quit)
@@ -204,6 +328,9 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
         self.request_parameters.connect(self.worker.get_parameters)
         self.request_offset_range.connect(self.worker.get_offset_range)
         self.signal_stop_streaming.connect(self.worker.stop_streaming)
+        self.signal_start_recording.connect(self.worker.start_recording)
+        self.signal_stop_recording.connect(self.worker.stop_recording)
+        self.signal_calibrate_defects.connect(self.worker.calibrate_defects)
 
         self.worker.update.connect(self.doUpdate)
         self.worker.connected.connect(self.onConnect)
@@ -211,7 +338,10 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
         self.worker.parametersUpdated.connect(self.onParametersUpdated)
         self.worker.offsetRangeUpdated.connect(self.update_offset)
         self.worker.binningUpdated.connect(self.update_size_and_offset)
+        self.worker.roiUpdated.connect(self.on_roi_updated)
         self.worker.imageTransformUpdated.connect(self.set_image_transform)
+        self.worker.recordingFailed.connect(self.onRecordingFailed)
+        self.worker.defectMapUpdated.connect(self.onDefectMapUpdated)
 
         self.exposureField.valueChanged.connect(self.worker.change_exposure)
         self.gainField.valueChanged.connect(self.worker.change_gain)
@@ -244,10 +374,19 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
     def disconnect_camera(self):
         self.serial_number = None
         self.first_image = True
+        # The worker deletes itself once it disconnects, its frames are dropped rather
+        # than handed back to it
+        self.activeWorker = None
+        self.displayTimer.stop()
+        self.latestData = None
+        self.displayedData = None
         self.stop_streaming()
         self.disconnect.emit()
         self.startButton.setEnabled(False)
         self.stopButton.setEnabled(False)
+        self.startRecordingButton.setEnabled(False)
+        self.stopRecordingButton.setEnabled(False)
+        self.calibrateDefectsButton.setEnabled(False)
         self.connectButton.setEnabled(True)
         self.disconnectButton.setEnabled(False)
         # self.refreshButton.setEnabled(True)
@@ -269,7 +408,10 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
         """Updates the gui when the camera is connected."""
         self.statusbar.showMessage("Connected to camera {}".format(self.name))
         self.baseMessage = "Connected to camera {} | ".format(self.name)
+        self.displayTimer.start()
         self.startButton.setEnabled(True)
+        self.startRecordingButton.setEnabled(True)
+        self.calibrateDefectsButton.setEnabled(True)
         self.connectButton.setEnabled(False)
         self.disconnectButton.setEnabled(True)
         # self.refreshButton.setEnabled(False)
@@ -371,6 +513,21 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
 
         self.update_offset(parameters)
 
+    @pyqtSlot(dict)
+    def on_roi_updated(self, parameters):
+        """Shows an ROI the worker set itself, without writing it back to the camera."""
+        fields = [
+            self.widthField,
+            self.heightField,
+            self.offsetXField,
+            self.offsetYField,
+        ]
+        for field in fields:
+            field.blockSignals(True)
+        self.update_size_and_offset(parameters)
+        for field in fields:
+            field.blockSignals(False)
+
     @pyqtSlot(int, int, float, float)
     def set_image_transform(self, sx, sy, scalex, scaley):
         tr = QtGui.QTransform()
@@ -385,32 +542,80 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
     # -----------------------------------------------------------------
     @pyqtSlot(dict)
     def doUpdate(self, data):
-        """Updates the plot/gui when a new image is recieved."""
-        # self.img = img
-        self.update_plot(data)
-        # if self.streaming:
-        #     self.request_image.emit()
-        self.printFramerate()
-        self.update.emit(data)
+        """Keeps the newest analyzed image, it is drawn on the next display refresh."""
+        # Updates still queued when the camera was disconnected belong to a worker that
+        # is gone or about to be
+        if self.activeWorker is None or self.sender() is not self.activeWorker:
+            return
+        timing.stamp(data["timestamps"], "received")
+        self.timing.add_timestamps(data["timestamps"])
+        metadata = data.get("metadata")
+        if metadata is not None:
+            # The first stamp is the host time the frame arrived from the camera
+            self.clockOffset.update(
+                metadata["camera_timestamp"], data["timestamps"][0][1]
+            )
+        if self.latestData is not None:
+            # Never displayed, its buffer can be reused
+            self.worker.release_image(self.latestData["image"])
+        self.latestData = data
+        self.analysisRate.tick()
 
-    def printFramerate(self):
-        """Calculates the framerate and prints it to the statusbar."""
-        currentTime = time.time()
-        elapsed = currentTime - self.lastTime
-        if elapsed == 0:
+    @pyqtSlot()
+    def render(self):
+        """Updates the plot/gui with the latest analyzed image, if there is a new one."""
+        data = self.latestData
+        if data is None:
             return
-        self.elapsed[self.i_elapsed] = elapsed
-        self.i_elapsed = (self.i_elapsed + 1) % self.N_elapsed
-        frameRate = 1.0 / np.average(elapsed)
-        self.statusbar.showMessage(
-            self.baseMessage + "Streaming at {:0.2f} fps".format(frameRate)
+        self.latestData = None
+        timestamps = data["timestamps"]
+        timing.stamp(timestamps, "display timer")
+        self.update_plot(data)
+        self.displayRate.tick()
+        self.printFramerate(data)
+        # Other windows are also only updated at the display rate
+        self.update.emit(data)
+        timing.stamp(timestamps, "paint")
+        self.timing.add_timestamps(timestamps[-3:])
+        self.timing.add("grab to screen", timestamps[-1][1] - timestamps[0][1])
+        metadata = data.get("metadata")
+        if metadata is not None:
+            cameraTime = self.clockOffset.to_host(metadata["camera_timestamp"])
+            self.timing.add("camera to screen", timestamps[-1][1] - cameraTime)
+        # Everything now shows the new image, the previous buffer can be reused
+        if self.displayedData is not None:
+            self.worker.release_image(self.displayedData["image"])
+        self.displayedData = data
+
+    def printFramerate(self, data):
+        """Prints the analysis and display framerates to the statusbar."""
+        message = self.baseMessage + "Analyzing at {:0.2f} fps".format(
+            self.analysisRate.rate()
         )
-        self.lastTime = currentTime
+        message += " | Displaying at {:0.2f} fps".format(self.displayRate.rate())
+        if "mailbox" in data:
+            message += " | {} frames dropped".format(data["mailbox"]["dropped"])
+        metadata = data.get("metadata")
+        if metadata is not None:
+            message += " | {} skipped, {} lost by the camera".format(
+                metadata["skipped"], metadata["lost"]
+            )
+        if "recording" in data:
+            recording = data["recording"]
+            message += " | Recorded {} frames at {:0.1f} MB/s, {} dropped".format(
+                recording["written"],
+                recording["throughput"] * 1e-6,
+                recording["dropped"] + recording["mismatched"],
+            )
+        self.statusbar.showMessage(message)
 
     @pyqtSlot()
     def start_streaming(self):
         """Starts streaming images from the camera."""
         self.streaming = True
+        self.analysisRate.reset()
+        self.displayRate.reset()
+        self.clockOffset.reset()
         self.worker.start_streaming()
         # self.request_image.emit()
         self.stopButton.setEnabled(True)
@@ -440,8 +645,9 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
         self.centroid = data["centroid"]
         if self.first_image:
             # Set the imageView rather than the imageViewItem to use autoRange on the first image
+            # The imageView keeps this image, so it can't be a buffer that gets reused
             self.imageView.setImage(
-                img, autoRange=True, autoLevels=False, autoHistogramRange=False
+                img.copy(), autoRange=True, autoLevels=False, autoHistogramRange=False
             )
             self.first_image = False
             # This is a bit of an akward way to do this, but it needs to be done after setting the image
@@ -456,8 +662,10 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
             self.imageView.getImageItem().setImage(
                 img, autoLevels=False, autoHistogramRange=False
             )
+        frameStats = data["stats"]
+        self.imageView.getHistogramWidget().plot.setData(*frameStats["histogram"])
         if self.normalizeCheckBox.isChecked():
-            self.set_hist_range(np.max(img))
+            self.set_hist_range(frameStats["max"])
         self.set_centroid_crosshair_x(data["centroid"][0])
         self.set_centroid_crosshair_y(data["centroid"][1])
 
@@ -563,6 +771,77 @@ class AlignViewMainWindow(QMainWindow, ui_MainWindow.Ui_AlignView):
         self.set_target_crosshair_x(self.centroidVLine.getPos()[0])
         self.set_target_crosshair_y(self.centroidHLine.getPos()[1])
 
+    # Methods for recording frames
+    # -----------------------------------------------------------------
+    @pyqtSlot()
+    def start_recording(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self,
+            "Record frames",
+            "" if config.savePath is None else config.savePath,
+            "Frame stack (*.npy);;HDF5 (*.h5)",
+        )
+        if not path:
+            return
+        self.signal_start_recording.emit(path)
+        self.startRecordingButton.setEnabled(False)
+        self.stopRecordingButton.setEnabled(True)
+
+    @pyqtSlot()
+    def stop_recording(self):
+        self.signal_stop_recording.emit()
+        self.startRecordingButton.setEnabled(True)
+        self.stopRecordingButton.setEnabled(False)
+
+    @pyqtSlot(object)
+    def onRecordingFailed(self, error):
+        QMessageBox.critical(self, "Error: Recording failed", str(error))
+        self.startRecordingButton.setEnabled(True)
+        self.stopRecordingButton.setEnabled(False)
+
+    # Methods for calibrating defective pixels
+    # -----------------------------------------------------------------
+    @pyqtSlot()
+    def calibrate_defects(self):
+        nFrames, ok = QInputDialog.getInt(
+            self,
+            "Calibrate defects",
+            "Cover the camera or block the beam, then choose the number of frames to "
+            "find the hot and dead pixels from:",
+            50,
+            2,
+            10000,
+        )
+        if not ok:
+            return
+        self.signal_calibrate_defects.emit(nFrames)
+
+    @pyqtSlot(int, str)
+    def onDefectMapUpdated(self, nDefects, path):
+        # The statusbar is overwritten by every frame, so the result gets a dialog
+        message = f"Found {nDefects} defective pixels."
+        if path:
+            message += f"\nThe defect map was saved to {path}"
+        else:
+            message += "\nThe defect map couldn't be saved, it is used until the "
+            message += "camera is disconnected."
+        QMessageBox.information(self, "Defect calibration", message)
+
+    @pyqtSlot()
+    def show_timing_panel(self):
+        if self.timingDock is not None:
+            self.timingDock.show()
+            return
+        self.timingDock = timingWindow.AlignViewTimingDock(self.timing, self)
+        self.timingDock.destroyed.connect(self.on_timing_panel_closed)
+        self.addDockWidget(
+            QtCore.Qt.DockWidgetArea.RightDockWidgetArea, self.timingDock
+        )
+
+    @pyqtSlot()
+    def on_timing_panel_closed(self):
+        self.timingDock = None
+
     @pyqtSlot()
     def show_lineout_window(self):
         self.lineWin = lineoutWindow.AlignViewLineoutWindow()
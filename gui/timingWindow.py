@@ -0,0 +1,111 @@
+import pyqtgraph as pg
+from PyQt6 import QtCore
+from PyQt6.QtCore import QTimer, pyqtSlot
+from PyQt6.QtWidgets import (
+    QDockWidget,
+    QFileDialog,
+    QHBoxLayout,
+    QPushButton,
+    QTableWidget,
+    QTableWidgetItem,
+    QVBoxLayout,
+    QWidget,
+)
+
+COLUMNS = ["count", "mean", "p50", "p95", "p99", "max"]
+
+
+class AlignViewTimingDock(QDockWidget):
+    """Dockable panel showing how long frames spend in each stage of the pipeline.
+
+    The table shows the statistics of the recent durations of each stage [ms] and the
+    plot the histogram of the selected stage. The panel only reads the TimingStats it is
+    given, it refreshes on its own timer so it doesn't slow down the display.
+    """
+
+    def __init__(self, timing, parent=None):
+        super().__init__("Timing", parent)
+        self.timing = timing
+        self.setAttribute(QtCore.Qt.WidgetAttribute.WA_DeleteOnClose, True)
+        self.setup_widgets()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(500)
+
+    def setup_widgets(self):
+        widget = QWidget()
+        layout = QVBoxLayout(widget)
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(
+            [c if c == "count" else c + " [ms]" for c in COLUMNS]
+        )
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        layout.addWidget(self.table)
+
+        self.plot = pg.PlotWidget()
+        self.plot.setLabel("bottom", "Duration", units="s")
+        self.plot.setLogMode(x=True, y=False)
+        self.histItem = self.plot.plot(stepMode="center", fillLevel=0, brush="g")
+        layout.addWidget(self.plot)
+
+        buttons = QHBoxLayout()
+        resetButton = QPushButton("Reset")
+        resetButton.clicked.connect(self.reset)
+        csvButton = QPushButton("Export CSV")
+        csvButton.clicked.connect(self.export_csv)
+        jsonButton = QPushButton("Export JSON")
+        jsonButton.clicked.connect(self.export_json)
+        buttons.addWidget(resetButton)
+        buttons.addWidget(csvButton)
+        buttons.addWidget(jsonButton)
+        layout.addLayout(buttons)
+        self.setWidget(widget)
+
+    @pyqtSlot()
+    def refresh(self):
+        summary = self.timing.summary()
+        self.table.setRowCount(len(summary))
+        self.table.setVerticalHeaderLabels(list(summary.keys()))
+        for i, stage in enumerate(summary.values()):
+            for j, column in enumerate(COLUMNS):
+                if column not in stage:
+                    text = ""
+                elif column == "count":
+                    text = str(stage[column])
+                else:
+                    text = "{:0.3f}".format(1e3 * stage[column])
+                self.table.setItem(i, j, QTableWidgetItem(text))
+        self.update_histogram(list(summary.keys()))
+
+    def update_histogram(self, names):
+        row = self.table.currentRow()
+        if row < 0 or row >= len(names):
+            self.histItem.clear()
+            return
+        edges, counts = self.timing.stages[names[row]].histogram()
+        if counts.sum() == 0:
+            self.histItem.clear()
+            return
+        self.histItem.setData(edges, counts)
+
+    @pyqtSlot()
+    def reset(self):
+        self.timing.reset()
+        self.refresh()
+
+    @pyqtSlot()
+    def export_csv(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export timing", "timing.csv", "CSV (*.csv)"
+        )
+        if path:
+            self.timing.save_csv(path)
+
+    @pyqtSlot()
+    def export_json(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export timing", "timing.json", "JSON (*.json)"
+        )
+        if path:
+            self.timing.save_json(path)
@@ -1,4 +1,4 @@
-# Form implementation generated from reading ui file 'designer\LineoutWindow.ui'
+# Form implementation generated from reading ui file 'designer/LineoutWindow.ui'
 #
 # Created by: PyQt6 UI code generator 6.9.1
 #
@@ -1,4 +1,4 @@
-# Form implementation generated from reading ui file 'designer\MainWindow.ui'
+# Form implementation generated from reading ui file 'designer/MainWindow.ui'
 #
 # Created by: PyQt6 UI code generator 6.9.1
 #
@@ -287,7 +287,7 @@ class Ui_AlignView(object):
         self.formLayout_2.setObjectName("formLayout_2")
         self.label_4 = QtWidgets.QLabel(parent=self.frame_2)
         self.label_4.setObjectName("label_4")
-        self.formLayout_2.setWidget(0, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_4)
+        self.formLayout_2.setWidget(2, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_4)
         self.binningHorizontalField = QtWidgets.QSpinBox(parent=self.frame_2)
         self.binningHorizontalField.setEnabled(False)
         self.binningHorizontalField.setMinimumSize(QtCore.QSize(100, 0))
@@ -295,46 +295,46 @@ class Ui_AlignView(object):
         self.binningHorizontalField.setMinimum(1)
         self.binningHorizontalField.setMaximum(4)
         self.binningHorizontalField.setObjectName("binningHorizontalField")
-        self.formLayout_2.setWidget(0, QtWidgets.QFormLayout.ItemRole.FieldRole, self.binningHorizontalField)
+        self.formLayout_2.setWidget(2, QtWidgets.QFormLayout.ItemRole.FieldRole, self.binningHorizontalField)
         self.pixelFormatField = QtWidgets.QComboBox(parent=self.frame_2)
         self.pixelFormatField.setEnabled(False)
         self.pixelFormatField.setMinimumSize(QtCore.QSize(100, 0))
         self.pixelFormatField.setMaximumSize(QtCore.QSize(100, 16777215))
         self.pixelFormatField.setObjectName("pixelFormatField")
-        self.formLayout_2.setWidget(5, QtWidgets.QFormLayout.ItemRole.FieldRole, self.pixelFormatField)
+        self.formLayout_2.setWidget(7, QtWidgets.QFormLayout.ItemRole.FieldRole, self.pixelFormatField)
         self.label_10 = QtWidgets.QLabel(parent=self.frame_2)
         self.label_10.setObjectName("label_10")
-        self.formLayout_2.setWidget(3, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_10)
+        self.formLayout_2.setWidget(5, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_10)
         self.triggerModeField = QtWidgets.QComboBox(parent=self.frame_2)
         self.triggerModeField.setEnabled(False)
         self.triggerModeField.setMinimumSize(QtCore.QSize(100, 0))
         self.triggerModeField.setMaximumSize(QtCore.QSize(100, 16777215))
         self.triggerModeField.setObjectName("triggerModeField")
-        self.formLayout_2.setWidget(3, QtWidgets.QFormLayout.ItemRole.FieldRole, self.triggerModeField)
+        self.formLayout_2.setWidget(5, QtWidgets.QFormLayout.ItemRole.FieldRole, self.triggerModeField)
         self.triggerSourceField = QtWidgets.QComboBox(parent=self.frame_2)
         self.triggerSourceField.setEnabled(False)
         self.triggerSourceField.setMinimumSize(QtCore.QSize(100, 0))
         self.triggerSourceField.setMaximumSize(QtCore.QSize(100, 16777215))
         self.triggerSourceField.setObjectName("triggerSourceField")
-        self.formLayout_2.setWidget(4, QtWidgets.QFormLayout.ItemRole.FieldRole, self.triggerSourceField)
+        self.formLayout_2.setWidget(6, QtWidgets.QFormLayout.ItemRole.FieldRole, self.triggerSourceField)
         self.label_9 = QtWidgets.QLabel(parent=self.frame_2)
         self.label_9.setObjectName("label_9")
-        self.formLayout_2.setWidget(4, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_9)
+        self.formLayout_2.setWidget(6, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_9)
         self.label_17 = QtWidgets.QLabel(parent=self.frame_2)
         self.label_17.setObjectName("label_17")
-        self.formLayout_2.setWidget(2, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_17)
+        self.formLayout_2.setWidget(4, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_17)
         self.label_16 = QtWidgets.QLabel(parent=self.frame_2)
         self.label_16.setObjectName("label_16")
-        self.formLayout_2.setWidget(5, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_16)
+        self.formLayout_2.setWidget(7, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_16)
         self.exposureModeField = QtWidgets.QComboBox(parent=self.frame_2)
         self.exposureModeField.setEnabled(False)
         self.exposureModeField.setMinimumSize(QtCore.QSize(100, 0))
         self.exposureModeField.setMaximumSize(QtCore.QSize(100, 16777215))
         self.exposureModeField.setObjectName("exposureModeField")
-        self.formLayout_2.setWidget(2, QtWidgets.QFormLayout.ItemRole.FieldRole, self.exposureModeField)
+        self.formLayout_2.setWidget(4, QtWidgets.QFormLayout.ItemRole.FieldRole, self.exposureModeField)
         self.label_18 = QtWidgets.QLabel(parent=self.frame_2)
         self.label_18.setObjectName("label_18")
-        self.formLayout_2.setWidget(1, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_18)
+        self.formLayout_2.setWidget(3, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_18)
         self.binningVerticalField = QtWidgets.QSpinBox(parent=self.frame_2)
         self.binningVerticalField.setEnabled(False)
         self.binningVerticalField.setMinimumSize(QtCore.QSize(100, 0))
@@ -342,13 +342,30 @@ class Ui_AlignView(object):
         self.binningVerticalField.setMinimum(1)
         self.binningVerticalField.setMaximum(4)
         self.binningVerticalField.setObjectName("binningVerticalField")
-        self.formLayout_2.setWidget(1, QtWidgets.QFormLayout.ItemRole.FieldRole, self.binningVerticalField)
+        self.formLayout_2.setWidget(3, QtWidgets.QFormLayout.ItemRole.FieldRole, self.binningVerticalField)
+        self.label_19 = QtWidgets.QLabel(parent=self.frame_2)
+        self.label_19.setObjectName("label_19")
+        self.formLayout_2.setWidget(0, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_19)
+        self.binningXModeField = QtWidgets.QComboBox(parent=self.frame_2)
+        self.binningXModeField.setMinimumSize(QtCore.QSize(100, 0))
+        self.binningXModeField.setMaximumSize(QtCore.QSize(100, 16777215))
+        self.binningXModeField.setObjectName("binningXModeField")
+        self.formLayout_2.setWidget(0, QtWidgets.QFormLayout.ItemRole.FieldRole, self.binningXModeField)
+        self.label_20 = QtWidgets.QLabel(parent=self.frame_2)
+        self.label_20.setObjectName("label_20")
+        self.formLayout_2.setWidget(1, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_20)
+        self.binningYModeField = QtWidgets.QComboBox(parent=self.frame_2)
+        self.binningYModeField.setMinimumSize(QtCore.QSize(100, 0))
+        self.binningYModeField.setMaximumSize(QtCore.QSize(100, 16777215))
+        self.binningYModeField.setObjectName("binningYModeField")
+        self.formLayout_2.setWidget(1, QtWidgets.QFormLayout.ItemRole.FieldRole, self.binningYModeField)
         self.verticalLayout_4.addLayout(self.formLayout_2)
         spacerItem1 = QtWidgets.QSpacerItem(20, 0, QtWidgets.QSizePolicy.Policy.Minimum, QtWidgets.QSizePolicy.Policy.Expanding)
         self.verticalLayout_4.addItem(spacerItem1)
         self.verticalLayout_3.addWidget(self.frame_2)
         self.toolBox.addItem(self.page_2, "")
         self.page_3 = QtWidgets.QWidget()
+        self.page_3.setGeometry(QtCore.QRect(0, 0, 200, 766))
         self.page_3.setObjectName("page_3")
         self.verticalLayout_5 = QtWidgets.QVBoxLayout(self.page_3)
         self.verticalLayout_5.setContentsMargins(0, 0, 0, 0)
@@ -364,6 +381,21 @@ class Ui_AlignView(object):
         self.displayLineoutsButton = QtWidgets.QPushButton(parent=self.frame_3)
         self.displayLineoutsButton.setObjectName("displayLineoutsButton")
         self.verticalLayout_6.addWidget(self.displayLineoutsButton)
+        self.displayTimingButton = QtWidgets.QPushButton(parent=self.frame_3)
+        self.displayTimingButton.setObjectName("displayTimingButton")
+        self.verticalLayout_6.addWidget(self.displayTimingButton)
+        self.startRecordingButton = QtWidgets.QPushButton(parent=self.frame_3)
+        self.startRecordingButton.setEnabled(False)
+        self.startRecordingButton.setObjectName("startRecordingButton")
+        self.verticalLayout_6.addWidget(self.startRecordingButton)
+        self.stopRecordingButton = QtWidgets.QPushButton(parent=self.frame_3)
+        self.stopRecordingButton.setEnabled(False)
+        self.stopRecordingButton.setObjectName("stopRecordingButton")
+        self.verticalLayout_6.addWidget(self.stopRecordingButton)
+        self.calibrateDefectsButton = QtWidgets.QPushButton(parent=self.frame_3)
+        self.calibrateDefectsButton.setEnabled(False)
+        self.calibrateDefectsButton.setObjectName("calibrateDefectsButton")
+        self.verticalLayout_6.addWidget(self.calibrateDefectsButton)
         spacerItem2 = QtWidgets.QSpacerItem(20, 0, QtWidgets.QSizePolicy.Policy.Minimum, QtWidgets.QSizePolicy.Policy.Expanding)
         self.verticalLayout_6.addItem(spacerItem2)
         self.verticalLayout_5.addWidget(self.frame_3)
@@ -430,6 +462,12 @@ class Ui_AlignView(object):
         self.label_17.setText(_translate("AlignView", "Exposure Mode"))
         self.label_16.setText(_translate("AlignView", "Pixel Format"))
         self.label_18.setText(_translate("AlignView", "Binning Y"))
+        self.label_19.setText(_translate("AlignView", "Binning X Mode"))
+        self.label_20.setText(_translate("AlignView", "Binning Y Mode"))
         self.toolBox.setItemText(self.toolBox.indexOf(self.page_2), _translate("AlignView", "Camera Settings"))
         self.displayLineoutsButton.setText(_translate("AlignView", "Display Lineouts"))
+        self.displayTimingButton.setText(_translate("AlignView", "Display Timing"))
+        self.startRecordingButton.setText(_translate("AlignView", "Start Recording"))
+        self.stopRecordingButton.setText(_translate("AlignView", "Stop Recording"))
+        self.calibrateDefectsButton.setText(_translate("AlignView", "Calibrate Defects"))
         self.toolBox.setItemText(self.toolBox.indexOf(self.page_3), _translate("AlignView", "Analysis"))
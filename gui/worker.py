@@ -1,8 +1,26 @@
+import re
+
 import numpy as np
-from PyQt6.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+from PyQt6.QtCore import QObject, QThread, QTimer, pyqtSignal, pyqtSlot
 from scipy import optimize
 
+import analysis.background as background
+import analysis.defects as defects
+import analysis.executor as executor
+import analysis.geometry as geometry
 import analysis.image as an
+import analysis.stats as stats
+import analysis.timing as timing
+import config
+from backends import recorder
+
+# Offsets and sizes of the automatic ROI are multiples of this, which satisfies the
+# increments cameras require [px]
+ROI_ALIGNMENT = 16
+
+
+def _align_up(value):
+    return int(np.ceil(value / ROI_ALIGNMENT)) * ROI_ALIGNMENT
 
 
 class Worker(QObject):
@@ -14,6 +32,10 @@ class Worker(QObject):
     offsetRangeUpdated = pyqtSignal(dict)
     binningUpdated = pyqtSignal(dict)
     imageTransformUpdated = pyqtSignal(int, int, float, float)
+    defectMapUpdated = pyqtSignal(int, str)
+    recordingFailed = pyqtSignal(object)
+    roiUpdated = pyqtSignal(dict)
+    analysisFinished = pyqtSignal(int, object)
 
     def __init__(self, serial_number, camera_class):
         super().__init__()
@@ -26,6 +48,30 @@ class Worker(QObject):
         self.scalex = None
         self.scaley = None
         self.config = {}
+        self.defectMap = None
+        self.defectCalibration = None
+        self.geometryCache = geometry.GeometryCache()
+        self.saturation = None
+        self.mailbox = None
+        self.bufferPool = None
+        self.background = background.Background()
+        self.executor = None
+        self.frameId = 0
+        self.nextFrameId = 0
+        self.pending = {}
+        self.results = {}
+        self.recorder = None
+        self.streaming = False
+        self.fullROI = None
+        self.autoROILost = 0
+        self.autoROIFound = 0
+        self.autoROIHold = 0
+        self.pendingWrites = {}
+        # A child of the worker, so it moves to the worker's thread with it
+        self.writeTimer = QTimer(self)
+        self.writeTimer.setInterval(round(1000 / config.parameterWriteRate))
+        self.writeTimer.timeout.connect(self.on_write_timer)
+        self.analysisFinished.connect(self.on_analysis_finished)
 
     @pyqtSlot()
     def connect_camera(self):
@@ -42,12 +88,16 @@ class Worker(QObject):
         self.sy = parameters["offsetY"]
         self.scalex = parameters["binning_horizontal"]
         self.scaley = parameters["binning_vertical"]
+        self.update_saturation(parameters["pixel_format"])
+        self.load_defect_map()
         self.connected.emit(parameters)
         self.camera.offsetX_changed.connect(self.update_offsetX)
         self.camera.offsetY_changed.connect(self.update_offsetY)
         self.camera.binning_horizontal_changed.connect(self.update_binning_horizontal)
         self.camera.binning_vertical_changed.connect(self.update_binning_vertical)
-        self.camera.image_grabbed.connect(self.on_new_image)
+        self.mailbox = self.camera.mailbox
+        self.bufferPool = self.camera.bufferPool
+        self.camera.frame_ready.connect(self.on_frame_ready)
 
     @pyqtSlot()
     def get_parameters(self):
@@ -122,14 +172,20 @@ class Worker(QObject):
     @pyqtSlot()
     def disconnect_camera(self):
         """Closes the connection to the camera."""
+        self.change_analysis_processes(0)
+        self.stop_recording()
+        self.writeTimer.stop()
+        self.flush_writes()
         self.camera.close()
         self.finished.emit()
 
     def start_streaming(self):
         self.camera.start_streaming()
+        self.streaming = True
 
     def stop_streaming(self):
         self.camera.stop_streaming()
+        self.streaming = False
 
     # @pyqtSlot()
     # def get_image(self):
@@ -137,30 +193,564 @@ class Worker(QObject):
     #     img = self.camera.get_image()
     #     self.process_image(img)
 
-    @pyqtSlot(dict)
-    def on_new_image(self, data):
-        self.process_image(data["image"])
+    @pyqtSlot()
+    def on_frame_ready(self):
+        # Frames that arrived while we were busy have already been replaced
+        data = self.mailbox.take()
+        if data is None:
+            return
+        timestamps = data.get("timestamps", [])
+        timing.stamp(timestamps, "dequeue")
+        self.process_image(data["image"], timestamps, data.get("metadata"))
+
+    def process_image(self, img, timestamps=None, metadata=None):
+        """Analyzes an image and emits the result on update.
 
-    def process_image(self, img):
-        data = {}
+        Args:
+            img: 2D array representing image data.
+            timestamps: The frame's list of (stage, time) stamps, the time each stage
+                finished is appended to it.
+            metadata: The frame id, camera and host times, loss counters and ROI offsets
+                from the camera, passed on with the result.
+        """
+        if timestamps is None:
+            timestamps = []
+        data = {"metadata": metadata}
+        sx, sy = self.frame_offsets(metadata)
         # Any image processing necessary
-        x, y = an.get_xy_arrays(img, self.sx, self.sy, self.scalex, self.scaley)
-        centroid, px, py, x_proj, y_proj = an.findImageCenter(
-            img, x, y, self.config, self.previousPx, self.previousPy
-        )
+        if self.defectCalibration is not None:
+            self.add_dark_frame(img)
+        geo = self.geometryCache.get(img.shape, sx, sy, self.scalex, self.scaley)
+        if self.defectMap is not None and self.config.get("defectCorrection", True):
+            img = self.correct_defects(img, geo, sx, sy)
+        x = geo.x
+        y = geo.y
+        timing.stamp(timestamps, "defects")
+        if self.executor is not None:
+            self.submit_image(img, geo, sx, sy, timestamps, metadata)
+            return
+        frameStats = stats.frame_statistics(img, self.saturation)
+        timing.stamp(timestamps, "statistics")
+        frame = self.subtract_background(img, geo)
+        timing.stamp(timestamps, "background")
+        # The projections of the raw frame can only be reused if nothing was subtracted
+        projections = None
+        if frame is img:
+            projections = (frameStats["x_proj"], frameStats["y_proj"])
+        window = None
+        if "trackingROI" in self.config and self.config["trackingROI"]:
+            centroid, px, py, x_proj, y_proj, window = an.trackImageCenter(
+                frame, x, y, self.config, self.previousPx, self.previousPy, projections
+            )
+        else:
+            centroid, px, py, x_proj, y_proj = an.findImageCenter(
+                frame, x, y, self.config, self.previousPx, self.previousPy, projections
+            )
+        timing.stamp(timestamps, "analysis")
         self.previousPx = px
         self.previousPy = py
         data["image"] = img
+        data["timestamps"] = timestamps
+        data["stats"] = frameStats
         data["x_proj"] = x_proj
         data["y_proj"] = y_proj
+        data["window"] = window
         data["centroid"] = centroid
-        data["x"] = x
-        data["y"] = y
-        data["sx"] = self.sx
-        data["sy"] = self.sy
+        data["px"] = px
+        data["py"] = py
+        data["sx"] = sx
+        data["sy"] = sy
         data["scalex"] = self.scalex
         data["scaley"] = self.scaley
+        self.emit_update(data, x, y)
+
+    def frame_offsets(self, metadata):
+        """Returns the ROI offsets the frame was grabbed with.
+
+        Moving the ROI doesn't stop the stream, so the frames exposed before the move
+        arrive after the worker's offsets have changed. The camera tags each frame with
+        its offsets, the worker's are only used for frames without them.
+        """
+        if metadata is None or "offsetX" not in metadata:
+            return self.sx, self.sy
+        return metadata["offsetX"], metadata["offsetY"]
+
+    def emit_update(self, data, x, y):
+        """Emits an analyzed frame, data has the transform the frame was analyzed with."""
+        data["x"] = x
+        data["y"] = y
+        if self.mailbox is not None:
+            data["mailbox"] = self.mailbox.counters()
+        if self.recorder is not None:
+            transform = (data["sx"], data["sy"], data["scalex"], data["scaley"])
+            self.recorder.record(data["image"], data["metadata"], transform)
+            data["recording"] = self.recorder.status()
+            if self.recorder.error is not None:
+                # The frames are no longer written, tell the gui and close the file
+                error = self.recorder.error
+                self.stop_recording()
+                self.recordingFailed.emit(error)
+        timing.stamp(data["timestamps"], "emit")
         self.update.emit(data)
+        if "autoROI" in self.config and self.config["autoROI"]:
+            self.update_auto_roi(x, y, data)
+
+    def release_image(self, img):
+        """Hands the image's buffer back to the camera, call once nothing uses it."""
+        if self.bufferPool is not None:
+            self.bufferPool.release(img)
+
+    # Recording
+    # -----------------------------------------------------------------
+    @pyqtSlot(str)
+    def start_recording(self, path: str):
+        """Starts recording every analyzed frame and its metadata to path.
+
+        recordingFailed is emitted if the file can't be opened, or later if writing to
+        it fails, which also stops the recording.
+
+        Args:
+            path: .h5 or .hdf5 to record to HDF5, otherwise a .npy stack with a csv index.
+        """
+        self.stop_recording()
+        try:
+            self.recorder = recorder.Recorder(path)
+        except Exception as error:
+            self.recordingFailed.emit(error)
+
+    @pyqtSlot()
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.stop()
+            self.recorder = None
+
+    # Multiprocess analysis
+    # -----------------------------------------------------------------
+    @pyqtSlot(int)
+    def change_analysis_processes(self, value: int):
+        """Sets the number of processes the analysis runs in.
+
+        Args:
+            value: Number of analysis processes, 0 analyzes the frames in this thread.
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        # Results still on their way are ignored
+        for data in self.pending.values():
+            self.release_image(data["image"])
+        self.pending = {}
+        self.results = {}
+        self.nextFrameId = self.frameId
+        self.config["processes"] = value
+        if value > 0:
+            self.executor = executor.ProcessPoolAnalyzer(
+                value, self.analysisFinished.emit
+            )
+
+    def submit_image(self, img, geo, sx, sy, timestamps, metadata):
+        """Hands the frame to the analysis processes, the result arrives in order.
+
+        Defect correction and background subtraction keep state between frames, so
+        they stay in this thread and the processes get the frame to analyze. The frame
+        statistics are of the raw frame, as without the processes, so they are also
+        computed here. The beam position the fits start from lags by the number of
+        frames in flight. The ROI can change while a frame is in flight, so its
+        transform is kept with it.
+        """
+        x = geo.x
+        y = geo.y
+        frameStats = stats.frame_statistics(img, self.saturation)
+        timing.stamp(timestamps, "statistics")
+        frame = self.subtract_background(img, geo)
+        timing.stamp(timestamps, "background")
+        # The projections of the raw frame can only be reused if nothing was subtracted
+        projections = None
+        if frame is img:
+            projections = (frameStats["x_proj"], frameStats["y_proj"])
+        frameId = self.frameId
+        if not self.executor.submit(
+            frameId,
+            frame,
+            x,
+            y,
+            self.config,
+            projections,
+            self.previousPx,
+            self.previousPy,
+        ):
+            # Every slot is busy, the frame is dropped
+            self.release_image(img)
+            return
+        self.frameId += 1
+        timing.stamp(timestamps, "submit")
+        self.pending[frameId] = {
+            "image": img,
+            "timestamps": timestamps,
+            "metadata": metadata,
+            "stats": frameStats,
+            "x": x,
+            "y": y,
+            "sx": sx,
+            "sy": sy,
+            "scalex": self.scalex,
+            "scaley": self.scaley,
+        }
+
+    @pyqtSlot(int, object)
+    def on_analysis_finished(self, frameId, result):
+        if frameId not in self.pending:
+            return
+        self.results[frameId] = result
+        # Emit every result that is next in line
+        while self.nextFrameId in self.results:
+            result = self.results.pop(self.nextFrameId)
+            data = self.pending.pop(self.nextFrameId)
+            self.nextFrameId += 1
+            if result is None:
+                self.release_image(data["image"])
+                continue
+            self.previousPx = result["px"]
+            self.previousPy = result["py"]
+            x = data.pop("x")
+            y = data.pop("y")
+            # The stages that ran in the analysis process
+            data["timestamps"].extend(result["timestamps"])
+            timing.stamp(data["timestamps"], "reorder")
+            data["x_proj"] = result["x_proj"]
+            data["y_proj"] = result["y_proj"]
+            data["window"] = result["window"]
+            data["centroid"] = result["centroid"]
+            data["px"] = result["px"]
+            data["py"] = result["py"]
+            self.emit_update(data, x, y)
+
+    # Automatic ROI
+    # -----------------------------------------------------------------
+    @pyqtSlot(bool)
+    def change_auto_roi(self, value: bool):
+        """Turns shrinking the camera's ROI to a margin around the beam on or off.
+
+        A smaller ROI lets the camera run at a higher frame rate. Either way the ROI
+        starts from the full sensor, so the beam can be found.
+        """
+        self.config["autoROI"] = value
+        self.autoROILost = 0
+        self.autoROIFound = 0
+        self.expand_roi()
+
+    def expand_roi(self):
+        """Sets the camera's ROI to the full sensor."""
+        self._restart_for(self._write_full_roi)
+        self.fullROI = (self.camera.get_width(), self.camera.get_height())
+        self.roi_changed()
+
+    def _write_full_roi(self):
+        # Offsets of 0 are valid for every size, and then the largest size is the sensor
+        self.camera.set_offsetX(0)
+        self.camera.set_offsetY(0)
+        self.camera.set_width(self.camera.get_width_range()[1])
+        self.camera.set_height(self.camera.get_height_range()[1])
+
+    def set_roi(self, offsetX, offsetY, width, height):
+        """Moves the camera's ROI, restarting the stream only if its size changes."""
+        camera = self.camera
+        if width == camera.get_width() and height == camera.get_height():
+            try:
+                camera.set_offsetX(offsetX)
+                camera.set_offsetY(offsetY)
+            except Exception:
+                # Some cameras only take offset changes while stopped
+                self._restart_for(lambda: self._write_roi(offsetX, offsetY))
+        else:
+            self._restart_for(lambda: self._write_roi(offsetX, offsetY, width, height))
+        self.roi_changed()
+
+    def _write_roi(self, offsetX, offsetY, width=None, height=None):
+        if width is not None:
+            self.camera.set_offsetX(0)
+            self.camera.set_offsetY(0)
+            self.camera.set_width(width)
+            self.camera.set_height(height)
+        self.camera.set_offsetX(offsetX)
+        self.camera.set_offsetY(offsetY)
+
+    def _restart_for(self, write):
+        """Calls write with the stream stopped, the ROI size is locked while it runs."""
+        streaming = self.streaming
+        if streaming:
+            self.stop_streaming()
+        try:
+            write()
+        finally:
+            if streaming:
+                self.start_streaming()
+
+    def roi_changed(self):
+        parameters = self.get_offset_and_size()
+        self.sx = parameters["offsetX"]
+        self.sy = parameters["offsetY"]
+        self.update_image_transform()
+        self.roiUpdated.emit(parameters)
+        self.autoROIFound = 0
+        # Frames exposed before the change may still be on their way
+        self.autoROIHold = 2
+        if "autoROIHold" in self.config:
+            self.autoROIHold = self.config["autoROIHold"]
+
+    def update_auto_roi(self, x, y, data):
+        """Fits the camera's ROI to the beam found in the last frame.
+
+        The beam needs config["autoROISigmas"] (default 5) sigmas on each side. The ROI
+        is moved when the beam leaves it and grown, with room to spare, when it is
+        smaller than the size the beam needs. It only shrinks when it is more than twice
+        that size and the beam is well inside it, see _beam_inside, so a fit on a beam
+        cut by the edge of the ROI can't drive it below the beam size. The shrink also
+        has to be asked for by config["autoROIFound"] (default 3) frames in a row, so a
+        single bad fit can't cut the beam off. After config["autoROILost"] (default 3)
+        frames without a beam the ROI goes back to the full sensor.
+        """
+        if self.autoROIHold > 0:
+            self.autoROIHold -= 1
+            return
+        px = data["px"]
+        py = data["py"]
+        if not (
+            self._beam_found(x, px, data["x_proj"])
+            and self._beam_found(y, py, data["y_proj"])
+        ):
+            self.autoROILost += 1
+            self.autoROIFound = 0
+            nLost = 3
+            if "autoROILost" in self.config:
+                nLost = self.config["autoROILost"]
+            full = (self.camera.get_width(), self.camera.get_height()) == self.fullROI
+            if self.autoROILost >= nLost and not full:
+                self.expand_roi()
+            return
+        self.autoROILost = 0
+        if self.fullROI is None:
+            self.fullROI = (self.camera.get_width(), self.camera.get_height())
+
+        nSigma = 5.0
+        if "autoROISigmas" in self.config:
+            nSigma = self.config["autoROISigmas"]
+        nMargin = 3.0
+        if "autoROIMargin" in self.config:
+            nMargin = self.config["autoROIMargin"]
+        offsetX, width = self._fit_roi(
+            px[1] / self.scalex,
+            nSigma * abs(px[2]) / self.scalex,
+            self.sx,
+            len(x),
+            self.camera.get_width_range()[0],
+            self.fullROI[0],
+            self._beam_inside(x, px, data["x_proj"], nSigma + nMargin),
+        )
+        offsetY, height = self._fit_roi(
+            py[1] / self.scaley,
+            nSigma * abs(py[2]) / self.scaley,
+            self.sy,
+            len(y),
+            self.camera.get_height_range()[0],
+            self.fullROI[1],
+            self._beam_inside(y, py, data["y_proj"], nSigma + nMargin),
+        )
+        if (offsetX, offsetY, width, height) == (self.sx, self.sy, len(x), len(y)):
+            self.autoROIFound = 0
+            return
+        nFound = 3
+        if "autoROIFound" in self.config:
+            nFound = self.config["autoROIFound"]
+        if width < len(x) or height < len(y):
+            self.autoROIFound += 1
+            if self.autoROIFound < nFound:
+                return
+        self.set_roi(offsetX, offsetY, width, height)
+
+    def _fit_roi(self, center, half, offset, size, minimum, full, shrink):
+        """Returns the offset and size of the ROI along one axis, in camera pixels.
+
+        Args:
+            center: Beam center [camera px].
+            half: Half of the size the beam needs [camera px].
+            offset: Current offset of the ROI.
+            size: Current size of the ROI.
+            minimum: Smallest size the camera allows.
+            full: Size of the sensor.
+            shrink: Whether the fit can be trusted to make the ROI smaller.
+        """
+        needed = min(max(_align_up(2 * half), _align_up(minimum)), full)
+        sizeOk = needed <= size and (size <= 2 * needed or not shrink)
+        if sizeOk and offset <= center - half and center + half <= offset + size:
+            return offset, size
+        if not sizeOk:
+            # Leave room for the beam to move and change size before the next resize
+            size = min(_align_up(1.25 * needed), full)
+        offset = int(center - size / 2) // ROI_ALIGNMENT * ROI_ALIGNMENT
+        offset = min(max(offset, 0), (full - size) // ROI_ALIGNMENT * ROI_ALIGNMENT)
+        return offset, size
+
+    def _beam_inside(self, x, p, projection, nSigma):
+        """Checks that the beam is far enough inside the ROI for its width to be trusted.
+
+        The fit needs nSigma sigmas on each side of the beam inside the ROI, which is
+        config["autoROISigmas"] plus config["autoROIMargin"] (default 3) sigmas, and the
+        projection has to be back down to the same level at both ends. A beam cut by the
+        edge of the ROI raises that end and can look much narrower than it is.
+        """
+        if not (
+            x[0] <= p[1] - nSigma * abs(p[2]) and p[1] + nSigma * abs(p[2]) <= x[-1]
+        ):
+            return False
+        n = max(1, len(projection) // 20)
+        ends = np.sort([projection[:n].mean(), projection[-n:].mean()])
+        return ends[1] - ends[0] < 0.1 * (projection.max() - ends[0])
+
+    def _beam_found(self, x, p, projection):
+        """Checks that a fit found a beam that stands out of the noise of the frame.
+
+        The noise is estimated from the differences between neighbouring values of
+        the projection, which a beam wider than a few pixels barely changes. The fit's
+        amplitude has to be config["autoROISNR"] (default 10) times the noise. The
+        projection also has to rise by about that amplitude, since a failed analysis
+        hands back the previous frame's fit, which may be of a beam that left the ROI.
+        """
+        if p is None or not np.all(np.isfinite(p)) or p[0] <= 0.0:
+            return False
+        if not (x[1] - x[0] <= p[2] < x[-1] - x[0] and x[0] <= p[1] <= x[-1]):
+            return False
+        snr = 10.0
+        if "autoROISNR" in self.config:
+            snr = self.config["autoROISNR"]
+        noise = 1.4826 * np.median(np.abs(np.diff(projection))) / np.sqrt(2)
+        rise = projection.max() - projection.min()
+        return p[0] > snr * noise and rise > 0.5 * p[0]
+
+    # Defect pixel correction
+    # -----------------------------------------------------------------
+    def load_defect_map(self):
+        """Loads the defect map saved for this camera, if there is one."""
+        if config.calibrationPath is None:
+            return
+        path = defects.defect_map_path(config.calibrationPath, self.serial_number)
+        try:
+            self.defectMap = defects.DefectMap.load(path)
+        except OSError:
+            self.defectMap = None
+        self.geometryCache.invalidate()
+
+    @pyqtSlot(int)
+    def calibrate_defects(self, nFrames: int):
+        """Finds the defective pixels from the next nFrames frames.
+
+        The camera should be covered or the beam blocked during the calibration.
+        defectMapUpdated is emitted with the number of defective pixels and the file the
+        map was saved to, empty if it couldn't be saved, once it is done.
+        """
+        self.defectCalibration = defects.DefectCalibration(nFrames)
+
+    def add_dark_frame(self, img):
+        if not self.defectCalibration.add(img):
+            return
+        mask = self.defectCalibration.find_defects()
+        self.defectCalibration = None
+        self.defectMap = defects.DefectMap.from_mask(
+            mask, self.sx, self.sy, self.scalex, self.scaley
+        )
+        self.geometryCache.invalidate()
+        path = ""
+        if config.calibrationPath is not None:
+            path = defects.defect_map_path(config.calibrationPath, self.serial_number)
+            try:
+                self.defectMap.save(path)
+            except OSError as error:
+                # The map is still used, it just has to be calibrated again next time
+                print(f"Error saving the defect map: {error}")
+                path = ""
+        self.defectMapUpdated.emit(len(self.defectMap), path)
+
+    def correct_defects(self, img, geo, sx, sy):
+        # The index arrays only have to be rebuilt when the ROI changes
+        corrector = geo.get(
+            "defectCorrector",
+            lambda g: self.defectMap.corrector(
+                g.shape, sx, sy, self.scalex, self.scaley
+            ),
+        )
+        if corrector is None:
+            return img
+        return corrector.correct(img)
+
+    # Background subtraction
+    # -----------------------------------------------------------------
+    def subtract_background(self, img, geo):
+        """Returns the background subtracted frame used for the analysis.
+
+        The model is kept per geometry, so moving the ROI or changing the binning
+        restarts a running background and drops a dark frame, which has to be captured
+        again.
+        """
+        if self.background.mode == "off":
+            return img
+        window = None
+        if self.previousPx is not None and self.previousPy is not None:
+            window = an.beam_window(geo.x, geo.y, self.previousPx, self.previousPy)
+        return self.background.process(img, window, geo.key)
+
+    @pyqtSlot(str)
+    def change_background_mode(self, value: str):
+        """Changes the background model.
+
+        Args:
+            value: "off", "dark" to subtract a captured dark frame or "running" for an
+                exponentially weighted running average of the frames around the beam.
+        """
+        self.background.mode = value
+        self.background.reset()
+
+    @pyqtSlot(float)
+    def change_background_alpha(self, value: float):
+        """Changes the weight of the newest frame in the running background."""
+        self.background.alpha = value
+
+    @pyqtSlot(int)
+    def capture_background(self, nFrames: int):
+        """Averages the next nFrames frames into the dark frame, the beam should be blocked."""
+        self.background.capture(nFrames)
+
+    # Parameter writes
+    # -----------------------------------------------------------------
+    def queue_write(self, write, value):
+        """Calls write(value), coalescing writes that come faster than the write rate.
+
+        Dragging a control sends a stream of values, and every camera write holds up
+        the analysis. The first value goes to the camera right away, the ones that
+        follow within 1 / config.parameterWriteRate only replace the value waiting to
+        be written when the interval ends, so only the latest value is written.
+
+        Args:
+            write: Method that writes the parameter, pending writes are kept per method.
+            value: Value to write.
+        """
+        self.pendingWrites[write] = value
+        if not self.writeTimer.isActive():
+            self.flush_writes()
+            self.writeTimer.start()
+
+    def flush_writes(self):
+        """Writes the pending values, in the order the parameters were first changed."""
+        pendingWrites = self.pendingWrites
+        self.pendingWrites = {}
+        for write, value in pendingWrites.items():
+            write(value)
+
+    @pyqtSlot()
+    def on_write_timer(self):
+        if self.pendingWrites:
+            self.flush_writes()
+        else:
+            self.writeTimer.stop()
 
     @pyqtSlot(float)
     def change_exposure(self, value: float):
@@ -169,32 +759,44 @@ class Worker(QObject):
         Args:
             value: Expsorue to set [ms].
         """
-        self.camera.set_exposure(value)
+        self.queue_write(self.camera.set_exposure, value)
 
     @pyqtSlot(float)
     def change_gain(self, value: float):
-        self.camera.set_gain(value)
+        self.queue_write(self.camera.set_gain, value)
 
     @pyqtSlot(int)
     def change_width(self, value: float):
+        self.queue_write(self.write_width, value)
+
+    def write_width(self, value):
         self.camera.set_width(value)
         parameters = self.get_offset_range()
         self.offsetRangeUpdated.emit(parameters)
 
     @pyqtSlot(int)
     def change_height(self, value: int):
+        self.queue_write(self.write_height, value)
+
+    def write_height(self, value):
         self.camera.set_height(value)
         parameters = self.get_offset_range()
         self.offsetRangeUpdated.emit(parameters)
 
     @pyqtSlot(int)
     def change_offsetX(self, value: int):
+        self.queue_write(self.write_offsetX, value)
+
+    def write_offsetX(self, value):
         self.camera.set_offsetX(value)
         self.sx = value
         self.update_image_transform()
 
     @pyqtSlot(int)
     def change_offsetY(self, value: int):
+        self.queue_write(self.write_offsetY, value)
+
+    def write_offsetY(self, value):
         self.camera.set_offsetY(value)
         self.sy = value
         self.update_image_transform()
@@ -224,6 +826,15 @@ class Worker(QObject):
     @pyqtSlot(str)
     def change_pixel_format(self, value):
         self.camera.set_pixel_format(value)
+        self.update_saturation(value)
+
+    def update_saturation(self, pixel_format):
+        """Sets the saturation level from the bit depth in the pixel format name."""
+        match = re.search(r"\d+", pixel_format)
+        if match is None:
+            self.saturation = None
+        else:
+            self.saturation = 2 ** int(match.group()) - 1
 
     @pyqtSlot(int)
     def change_binning_horizontal(self, value: int):
@@ -250,3 +861,17 @@ class Worker(QObject):
     def update_binning_vertical(self, value):
         self.scaley = value
         self.update_image_transform()
+
+    @pyqtSlot(bool)
+    def change_tracking_roi(self, value: bool):
+        """Turns analyzing only a window around the previous beam position on or off."""
+        self.config["trackingROI"] = value
+
+    @pyqtSlot(str)
+    def change_analysis_mode(self, value: str):
+        """Changes the analysis used to find the beam center.
+
+        Args:
+            value: "gaussian" to fit the projections, "moments" for ISO 11146 moments.
+        """
+        self.config["analysis"] = value
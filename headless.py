@@ -0,0 +1,264 @@
+"""Runs the camera and the beam analysis without the gui.
+
+Each analyzed frame is written as one record with the frame id, the camera and host
+times, and the centroid, width (sigma) and amplitude of the x and y projections:
+
+    python headless.py --serial 12345678 --output run.csv
+    python headless.py --test --frames 100
+
+Binary output is a flat file of RECORD_DTYPE records, read it back with
+np.fromfile(path, dtype=headless.RECORD_DTYPE).
+"""
+
+import argparse
+import multiprocessing
+import signal
+import sys
+
+import numpy as np
+
+import config
+
+RECORD_DTYPE = np.dtype(
+    [
+        ("frame_id", "int64"),
+        ("camera_timestamp", "float64"),
+        ("host_time", "float64"),
+        ("centroid_x", "float64"),
+        ("centroid_y", "float64"),
+        ("sigma_x", "float64"),
+        ("sigma_y", "float64"),
+        ("amplitude_x", "float64"),
+        ("amplitude_y", "float64"),
+    ]
+)
+
+
+def make_record(data, index):
+    """Returns the record of an analyzed frame, NaN for anything that is missing."""
+    record = np.zeros(1, dtype=RECORD_DTYPE)
+    for name in RECORD_DTYPE.names[1:]:
+        record[name] = np.nan
+    record["frame_id"] = index
+    metadata = data.get("metadata")
+    if metadata is not None:
+        record["frame_id"] = metadata["frame_id"]
+        record["camera_timestamp"] = metadata["camera_timestamp"]
+        record["host_time"] = metadata["host_time"]
+    record["centroid_x"], record["centroid_y"] = data["centroid"]
+    px = data.get("px")
+    py = data.get("py")
+    if px is not None:
+        record["amplitude_x"], record["sigma_x"] = px[0], px[2]
+    if py is not None:
+        record["amplitude_y"], record["sigma_y"] = py[0], py[2]
+    return record
+
+
+class CsvWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.stream.write(",".join(RECORD_DTYPE.names) + "\n")
+
+    def write(self, record):
+        self.stream.write(",".join(repr(v) for v in record[0].tolist()) + "\n")
+
+    def close(self):
+        self.stream.flush()
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+class BinaryWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, record):
+        self.stream.write(record.tobytes())
+
+    def close(self):
+        self.stream.flush()
+        if self.stream is not sys.stdout.buffer:
+            self.stream.close()
+
+
+def open_writer(path, format):
+    if format == "csv":
+        stream = sys.stdout if path == "-" else open(path, "w", newline="")
+        return CsvWriter(stream)
+    stream = sys.stdout.buffer if path == "-" else open(path, "wb")
+    return BinaryWriter(stream)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    camera = parser.add_mutually_exclusive_group(required=True)
+    camera.add_argument("--serial", help="Serial number of the Basler camera.")
+    camera.add_argument("--test", action="store_true", help="Use the test camera.")
+    camera.add_argument("--replay", help="Play back a recording instead of a camera.")
+    parser.add_argument(
+        "--fps",
+        type=float,
+        help="Frame rate of the test camera, 0 for as fast as possible.",
+    )
+    parser.add_argument(
+        "--scenario",
+        default="jitter",
+        help="Scenario the test camera plays, see camera_test.SCENARIOS.",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the test camera's scenario."
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Replay speed relative to the recording, 0 for as fast as possible.",
+    )
+    parser.add_argument(
+        "--output", default="-", help="File to write the records to, - for stdout."
+    )
+    parser.add_argument("--format", choices=["csv", "binary"], default="csv")
+    parser.add_argument("--frames", type=int, help="Stop after this many frames.")
+    parser.add_argument("--duration", type=float, help="Stop after this many s.")
+    parser.add_argument("--exposure", type=float, help="Exposure time [ms].")
+    parser.add_argument("--gain", type=float, help="Gain [dB].")
+    parser.add_argument(
+        "--analysis", choices=["gaussian", "moments"], default="gaussian"
+    )
+    parser.add_argument("--fast-fit", action="store_true", help="Use the fast fit.")
+    parser.add_argument(
+        "--tracking", action="store_true", help="Only analyze around the beam."
+    )
+    parser.add_argument(
+        "--processes", type=int, default=0, help="Analysis processes, 0 for none."
+    )
+    parser.add_argument(
+        "--auto-roi",
+        action="store_true",
+        help="Shrink the camera's ROI to the beam for a higher frame rate.",
+    )
+    parser.add_argument(
+        "--calibrate-defects",
+        type=int,
+        metavar="N",
+        help="Find the defective pixels from the first N frames, the camera should be "
+        "covered or the beam blocked, and save the defect map.",
+    )
+    return parser.parse_args(argv)
+
+
+class HeadlessRun:
+    """Connects the worker to the camera and writes a record for each analyzed frame."""
+
+    def __init__(self, app, worker, writer, nFrames=None):
+        self.app = app
+        self.worker = worker
+        self.writer = writer
+        self.nFrames = nFrames
+        self.count = 0
+        self.stopped = False
+
+    def on_update(self, data):
+        if self.stopped:
+            return
+        self.writer.write(make_record(data, self.count))
+        # Nothing keeps the image, its buffer can be reused right away
+        self.worker.release_image(data["image"])
+        self.count += 1
+        if self.nFrames is not None and self.count >= self.nFrames:
+            self.stop()
+
+    def on_defect_map_updated(self, nDefects, path):
+        message = f"Found {nDefects} defective pixels"
+        if path:
+            message += f", defect map saved to {path}"
+        print(message, file=sys.stderr)
+
+    def on_connection_failed(self, error):
+        print(f"Failed to connect: {error}", file=sys.stderr)
+        self.app.exit(1)
+
+    def stop(self):
+        if self.stopped:
+            return
+        self.stopped = True
+        self.worker.stop_streaming()
+        self.worker.disconnect_camera()
+        self.writer.close()
+        self.app.quit()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config.defPaths()
+
+    from PyQt6.QtCore import QCoreApplication, QTimer
+
+    from gui.worker import Worker
+
+    # Only the backend that is used is imported, the test camera doesn't need pylon
+    if args.test:
+        from backends.camera_test import SCENARIOS
+        from backends.camera_test import TestCam as camera_class
+
+        if args.scenario not in SCENARIOS:
+            print(f"Unknown scenario, choose from {list(SCENARIOS)}", file=sys.stderr)
+            return 2
+        config.testScenario = args.scenario
+        config.testSeed = args.seed
+        if args.fps is not None:
+            config.testFrameRate = args.fps
+        serial = "test"
+    elif args.replay is not None:
+        from backends.camera_replay import Replay as camera_class
+
+        serial = args.replay
+    else:
+        from backends.camera_basler import Basler as camera_class
+
+        serial = args.serial
+
+    app = QCoreApplication(sys.argv[:1])
+    worker = Worker(serial, camera_class)
+    worker.config["analysis"] = args.analysis
+    worker.config["fastFit"] = args.fast_fit
+    worker.config["trackingROI"] = args.tracking
+    writer = open_writer(args.output, args.format)
+    run = HeadlessRun(app, worker, writer, args.frames)
+    worker.update.connect(run.on_update)
+    worker.connectionFailed.connect(run.on_connection_failed)
+    worker.defectMapUpdated.connect(run.on_defect_map_updated)
+
+    worker.connect_camera()
+    if not hasattr(worker, "camera"):
+        writer.close()
+        return 1
+    if args.replay is not None:
+        worker.camera.set_speed(args.speed)
+    if args.exposure is not None:
+        worker.change_exposure(args.exposure)
+    if args.gain is not None:
+        worker.change_gain(args.gain)
+    if args.processes > 0:
+        worker.change_analysis_processes(args.processes)
+    if args.auto_roi:
+        worker.change_auto_roi(True)
+    if args.calibrate_defects is not None:
+        worker.calibrate_defects(args.calibrate_defects)
+    worker.start_streaming()
+
+    # Qt's event loop doesn't give Python a chance to handle Ctrl+C, so wake it up
+    signal.signal(signal.SIGINT, lambda *args: run.stop())
+    timer = QTimer()
+    timer.timeout.connect(lambda: None)
+    timer.start(200)
+    if args.duration is not None:
+        QTimer.singleShot(int(1000 * args.duration), run.stop)
+    return app.exec()
+
+
+if __name__ == "__main__":
+    # The analysis processes of a frozen bundle are started by running it again
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -3,7 +3,13 @@ from abc import ABC, abstractmethod
 
 class Enumerate(ABC):
     @abstractmethod
-    def enumerate_devices(self):
+    def enumerate_devices(self, progress=None):
+        """Finds the available devices.
+
+        Args:
+            progress: Called without arguments whenever more devices have been found,
+                backends that find every device at once don't have to call it.
+        """
         pass
 
     @abstractmethod